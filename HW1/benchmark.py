@@ -0,0 +1,190 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import typing as tp
+
+from replay_server import ReplayServer, load_fixtures
+
+# Имя файла программы содержит дефис, поэтому обычный import не подходит
+_spec = importlib.util.spec_from_file_location(
+    'wiki_stats', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'wiki-stats.py'))
+wiki_stats = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(wiki_stats)
+
+
+class Stage:
+    """
+    Measures one stage of a run: the wall time and the requests and bytes
+    served by the replay server during the stage
+    """
+    def __init__(self, server: ReplayServer):
+        self._server = server
+        self.report: dict[str, float] = {}
+
+    def __enter__(self) -> 'Stage':
+        self._stats = dict(self._server.stats)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.report['wall_time'] = time.perf_counter() - self._start
+        for name, value in self._server.stats.items():
+            self.report[name] = value - self._stats[name]
+
+
+def run_staged(page: str, lang: str, fetcher: tp.Any, backend: str,
+               concurrency: int, server: ReplayServer, work_dir: str) \
+        -> dict[str, dict[str, float]]:
+    """
+    Runs the steps of go_to_wiki one by one and measures every stage
+    :param page: request
+    :param lang: National Wiki Section
+    :param fetcher: HTTP session of wiki-stats
+    :param backend: the way neighbours are found ('html' or 'api')
+    :param concurrency: number of simultaneous requests
+    :param server: the replay server
+    :param work_dir: the directory for the output files
+    :return: dictionary stage -> its measurements
+    """
+    stages: dict[str, Stage] = {name: Stage(server) for name in (
+        'fetch', 'parse', 'disambiguation', 'external_links', 'neighbours')}
+    with stages['fetch']:
+        response = fetcher.get(f'http://{lang}.wikipedia.org/wiki/{page}')
+    with stages['parse']:
+        wiki_page = wiki_stats.WikiPage(response, lang)
+    with stages['disambiguation']:
+        informative = wiki_stats.information_pages_test(
+            wiki_page, page, lang, fetcher, concurrency)
+    if informative:
+        with stages['external_links']:
+            wiki_stats.get_external_links(
+                wiki_page, lang, os.path.join(work_dir, 'links.txt'))
+        with stages['neighbours']:
+            wiki_stats.get_category_neighbours(
+                wiki_page, lang, os.path.join(work_dir, 'nearest.txt'),
+                concurrency, fetcher, backend)
+    return {name: stage.report for name, stage in stages.items()
+            if stage.report}
+
+
+def run_config(page: str, lang: str, backend: str, concurrency: int,
+               server: ReplayServer, rate: float | None) -> dict:
+    """
+    One measurement of a configuration: go_to_wiki end to end (with the
+    metrics of its session) and then the same work stage by stage, each time
+    with a new session and no cache
+    :param page: request
+    :param lang: National Wiki Section
+    :param backend: the way neighbours are found ('html' or 'api')
+    :param concurrency: number of simultaneous requests
+    :param server: the replay server
+    :param rate: requests per second to one host (no limit if None)
+    :return: the measurements
+    """
+    proxy = f'http://{server.server_address[0]}:{server.server_address[1]}'
+    with tempfile.TemporaryDirectory() as work_dir:
+        fetcher = wiki_stats.Fetcher(pool_size=concurrency, rate=rate,
+                                     proxy=proxy)
+        # Вывод программы и полосы прогресса только мешают отчету
+        with Stage(server) as total, \
+                contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()):
+            wiki_stats.go_to_wiki(page, lang,
+                                  os.path.join(work_dir, 'links.txt'),
+                                  os.path.join(work_dir, 'nearest.txt'),
+                                  concurrency, fetcher, backend)
+        fetcher.close()
+        metrics = fetcher.metrics.report()
+        fetcher = wiki_stats.Fetcher(pool_size=concurrency, rate=rate,
+                                     proxy=proxy)
+        with contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()):
+            stages = run_staged(page, lang, fetcher, backend, concurrency,
+                                server, work_dir)
+        fetcher.close()
+    report = total.report
+    # Страницами считаются только успешно отданные ответы
+    pages = report['requests'] - report['errors'] - report['not_found']
+    return {'backend': backend, 'concurrency': concurrency,
+            **report, 'pages_per_sec': pages / report['wall_time'],
+            'stages': stages, 'metrics': metrics}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='benchmark',
+        description='Throughput benchmark of wiki-stats.py without the '
+                    'network: the recorded fixtures are replayed by a local '
+                    'server, every configuration is measured end to end and '
+                    'stage by stage')
+    parser.add_argument('fixtures', type=str,
+                        help='JSONL file of fixtures '
+                             '(wiki-stats.py --record)')
+    parser.add_argument('page', type=str,
+                        help='The query recorded in the fixtures')
+    parser.add_argument('--lang', type=str, default='en',
+                        help='National wikipedia section. Default = en')
+    parser.add_argument('--backend', nargs='+', default=['html'],
+                        choices=[*wiki_stats.BACKENDS],
+                        help='Backends to compare. Default = html')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1],
+                        help='Numbers of simultaneous requests to compare. '
+                             'Default = 1')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of measurements of every '
+                             'configuration. Default = 3')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='Requests per second to one host. '
+                             'Default = no limit')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Delay of every answer in milliseconds. '
+                             'Default = 0')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Maximal random addition to the delay in '
+                             'milliseconds. Default = 0')
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                        help='Share of requests answered with 503. '
+                             'Default = 0')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random delays and errors. '
+                             'Default = 0')
+    parser.add_argument('--out', type=str, default=None,
+                        help='The file for the JSON report. '
+                             'Default = standard output')
+    args = parser.parse_args()
+    server = ReplayServer(('127.0.0.1', 0), load_fixtures(args.fixtures),
+                          latency=args.latency / 1000,
+                          jitter=args.jitter / 1000,
+                          error_rate=args.error_rate, seed=args.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = []
+    try:
+        for backend in args.backend:
+            for concurrency in args.concurrency:
+                for _ in range(args.repeat):
+                    results.append(run_config(args.page, args.lang, backend,
+                                              concurrency, server,
+                                              args.rate))
+    finally:
+        server.shutdown()
+        server.server_close()
+    report = json.dumps({'page': args.page, 'lang': args.lang,
+                         'latency': args.latency, 'jitter': args.jitter,
+                         'error_rate': args.error_rate, 'results': results},
+                        indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, mode='w', encoding='utf-8') as f:
+            print(report, file=f)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+def load_fixtures(path: str) -> dict[str, dict]:
+    """
+    Reads the fixtures recorded by wiki-stats.py --record
+    :param path: JSONL file of fixtures
+    :return: dictionary url -> recorded response (the last one wins)
+    """
+    fixtures: dict[str, dict] = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record['body'] = base64.b64decode(record['body'])
+            fixtures[record['url']] = record
+    return fixtures
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    Local stand-in for Wikipedia replaying recorded responses. It works as
+    an HTTP proxy (wiki-stats.py --proxy http://host:port), the requests may
+    also be sent to it directly. Every answer is delayed by latency seconds
+    plus a uniform jitter, a share error_rate of the requests is answered
+    with error_status. Counters of requests and bytes are kept for
+    benchmarks
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], fixtures: dict[str, dict],
+                 latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503,
+                 seed: int | None = None):
+        super().__init__(address, ReplayHandler)
+        self.fixtures = fixtures
+        # При прямых запросах хоста в адресе нет, ищем по пути
+        self.fixtures_by_path = {self.path_of(url): record
+                                 for url, record in fixtures.items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @staticmethod
+    def path_of(url: str) -> str:
+        """
+        Auxiliary function for the path of an address together with the query
+        :param url: the address
+        :return: path and query
+        """
+        parts = urlsplit(url)
+        return f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+    def reset_stats(self) -> None:
+        """
+        Resets the counters
+        :return: None
+        """
+        with self._lock:
+            self.stats = {'requests': 0, 'bytes': 0, 'not_modified': 0,
+                          'not_found': 0, 'errors': 0}
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Increases a counter
+        :param name: the name of the counter
+        :param value: the increment
+        :return: None
+        """
+        with self._lock:
+            self.stats[name] += value
+
+    def draw_delay(self) -> float:
+        """
+        Draws the delay of the next answer
+        :return: delay in seconds
+        """
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def draw_error(self) -> bool:
+        """
+        Decides whether the next answer is an injected error
+        :return: True if an error has to be returned
+        """
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    Handler of ReplayServer: answers GET requests with the fixtures
+    """
+    protocol_version = 'HTTP/1.1'
+    server: ReplayServer
+
+    def do_GET(self) -> None:
+        self.server.count('requests')
+        time.sleep(self.server.draw_delay())
+        if self.server.draw_error():
+            self.server.count('errors')
+            self._answer(self.server.error_status, b'',
+                         {'Retry-After': '0'})
+            return
+        record = (self.server.fixtures.get(self.path)
+                  or self.server.fixtures_by_path.get(self.path))
+        if record is None:
+            self.server.count('not_found')
+            self._answer(404, b'Not in fixtures',
+                         {'Content-Type': 'text/plain; charset=utf-8'})
+            return
+        etag = record['headers'].get('ETag')
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.server.count('not_modified')
+            self._answer(304, b'', {'ETag': etag})
+            return
+        self.server.count('bytes', len(record['body']))
+        self._answer(record['status'], record['body'], record['headers'])
+
+    def _answer(self, status: int, body: bytes,
+                headers: dict[str, str]) -> None:
+        """
+        Sends an answer
+        :param status: HTTP status
+        :param body: body of the answer
+        :param headers: headers of the answer
+        :return: None
+        """
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Сервер используется в бенчмарках, лог каждого запроса не нужен
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='replay_server',
+        description='Local stand-in for Wikipedia replaying the responses '
+                    'recorded by wiki-stats.py --record. Point wiki-stats.py '
+                    'at it with --proxy http://127.0.0.1:PORT')
+    parser.add_argument('fixtures', type=str,
+                        help='JSONL file of fixtures')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Port of the server. Default = 8765')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Delay of every answer in milliseconds. '
+                             'Default = 0')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Maximal random addition to the delay in '
+                             'milliseconds. Default = 0')
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                        help='Share of requests answered with an error. '
+                             'Default = 0')
+    parser.add_argument('--error_status', type=int, default=503,
+                        help='HTTP status of the injected errors. '
+                             'Default = 503')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of the random delays and errors')
+    args = parser.parse_args()
+    server = ReplayServer(('127.0.0.1', args.port),
+                          load_fixtures(args.fixtures),
+                          latency=args.latency / 1000,
+                          jitter=args.jitter / 1000,
+                          error_rate=args.error_rate,
+                          error_status=args.error_status, seed=args.seed)
+    print(f'Replaying {len(server.fixtures)} responses on '
+          f'http://127.0.0.1:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
+import typing as tp
+import unittest
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from replay_server import ReplayServer
+
+# Имя файла программы содержит дефис, поэтому обычный import не подходит
+_spec = importlib.util.spec_from_file_location(
+    'wiki_stats', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'wiki-stats.py'))
+wiki_stats = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(wiki_stats)
+
+# Небольшая вики: у страницы Page i категории Cat j для битов j числа i,
+# Alias 5 - перенаправление на Page 5, оно само тоже лежит в категории
+CATEGORIES = [f'Cat{j}' for j in range(4)]
+PAGES = {f'Page {i}': [category for j, category in enumerate(CATEGORIES)
+                       if i >> j & 1] for i in range(1, 60)}
+PAGES['Base'] = CATEGORIES[:3]
+REDIRECTS = {'Alias 5': 'Page 5'}
+MEMBERS = {category: sorted(title for title, categories in PAGES.items()
+                            if category in categories)
+           for category in CATEGORIES}
+MEMBERS['Cat1'] = sorted([*MEMBERS['Cat1'], 'Alias 5'])
+# Маленькие порции, чтобы оба backend читали списки по частям
+HTML_PAGE_SIZE = 10
+API_LIMIT = 7
+
+
+def catlinks(categories: list[str]) -> str:
+    items = ''.join(f'<li><a href="/wiki/Category:{category}" '
+                    f'title="Category:{category}">{category}</a></li>'
+                    for category in categories)
+    return ('<div id="catlinks" class="catlinks"><div id="mw-normal-catlinks"'
+            ' class="mw-normal-catlinks"><a href="/wiki/Special:Categories">'
+            f'Categories</a>: <ul>{items}</ul></div></div>')
+
+
+def article(title: str) -> str:
+    return ('<html><body><div class="mw-body-content"><div class="mw-content-'
+            f'ltr mw-parser-output"><p>{title}</p></div></div>'
+            f'{catlinks(PAGES[title])}</body></html>')
+
+
+def category_page(category: str, page_from: str | None) -> str:
+    members = MEMBERS[category]
+    start = members.index(page_from) if page_from else 0
+    portion = members[start:start + HTML_PAGE_SIZE]
+    items = ''.join(f'<li><a href="/wiki/{title.replace(" ", "_")}" '
+                    f'title="{title}">{title}</a></li>' for title in portion)
+    navigation = ''
+    if start + HTML_PAGE_SIZE < len(members):
+        navigation = (f'<a href="/w/index.php?title=Category:{category}&amp;'
+                      f'pagefrom={members[start + HTML_PAGE_SIZE]}#mw-pages">'
+                      'next page</a>')
+    return (f'<html><body><div id="mw-pages"><h2>Pages in category '
+            f'"{category}"</h2>{navigation}<div class="mw-content-ltr">'
+            f'<div class="mw-category mw-category-columns"><ul>{items}</ul>'
+            f'</div></div>{navigation}</div></body></html>')
+
+
+def api(query: dict[str, str]) -> str:
+    answer: dict = {}
+    if query.get('list') == 'categorymembers':
+        members = MEMBERS[query['cmtitle'].split(':', 1)[1]]
+        start = int(query.get('cmcontinue', 0))
+        answer['query'] = {'categorymembers': [
+            {'ns': 0, 'title': title}
+            for title in members[start:start + API_LIMIT]]}
+        if start + API_LIMIT < len(members):
+            answer['continue'] = {'cmcontinue': str(start + API_LIMIT),
+                                  'continue': '-||'}
+    elif query.get('prop') == 'categories':
+        titles = query['titles'].split('|')
+        redirects = [{'from': title, 'to': REDIRECTS[title]}
+                     for title in titles
+                     if title in REDIRECTS and 'redirects' in query]
+        titles = [*dict.fromkeys(REDIRECTS.get(title, title)
+                                 if redirects else title
+                                 for title in titles)]
+        # Категории всех страниц отдаются порциями по API_LIMIT
+        flat = [(title, category) for title in titles
+                for category in PAGES.get(title, [])]
+        start = int(query.get('clcontinue', 0))
+        portion = flat[start:start + API_LIMIT]
+        pages = []
+        for title in titles:
+            if title not in PAGES and title not in REDIRECTS:
+                pages.append({'title': title, 'missing': True})
+                continue
+            page: dict = {'ns': 0, 'title': title}
+            if names := [category for owner, category in portion
+                         if owner == title]:
+                page['categories'] = [{'ns': 14, 'title': f'Category:{name}'}
+                                      for name in names]
+            pages.append(page)
+        answer['query'] = {'pages': pages}
+        if redirects:
+            answer['query']['redirects'] = redirects
+        if start + API_LIMIT < len(flat):
+            answer['continue'] = {'clcontinue': str(start + API_LIMIT),
+                                  'continue': '||'}
+    return json.dumps(answer)
+
+
+def render(url: str) -> tuple[int, str, str]:
+    parts = urlsplit(url)
+    path = unquote(parts.path)
+    query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+    if path == '/w/api.php':
+        return 200, 'application/json; charset=utf-8', api(query)
+    if path == '/w/index.php':
+        return 200, 'text/html; charset=utf-8', category_page(
+            query['title'].split(':', 1)[1], query.get('pagefrom'))
+    title = path.removeprefix('/wiki/').replace('_', ' ')
+    if title.startswith('Category:'):
+        return 200, 'text/html; charset=utf-8', category_page(
+            title.split(':', 1)[1], None)
+    # По ссылке на перенаправление вики отдает целевую статью
+    title = REDIRECTS.get(title, title)
+    if title in PAGES:
+        return 200, 'text/html; charset=utf-8', article(title)
+    return 404, 'text/plain; charset=utf-8', 'Not found'
+
+
+class FakeWiki(dict):
+    """
+    Fixtures of ReplayServer generated on request: the neighbours are
+    batched in the order the crawl meets them, so the API requests cannot be
+    listed in advance
+    """
+    def get(self, url: str, default: tp.Any = None) -> dict | None:
+        if not url.startswith('http://'):
+            return default
+        status, content_type, body = render(url)
+        return {'url': url, 'status': status,
+                'headers': {'Content-Type': content_type},
+                'body': body.encode('utf-8')}
+
+
+class BackendsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = ReplayServer(('127.0.0.1', 0), FakeWiki())
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.proxy = (f'http://{cls.server.server_address[0]}:'
+                     f'{cls.server.server_address[1]}')
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def nearest(self, backend: str, concurrency: int) -> str:
+        """
+        Runs the program for the page Base through the stand-in server
+        :param backend: the way neighbours are found ('html' or 'api')
+        :param concurrency: number of simultaneous requests
+        :return: text of the nearest file
+        """
+        with tempfile.TemporaryDirectory() as work_dir:
+            fetcher = wiki_stats.Fetcher(pool_size=concurrency,
+                                         proxy=self.proxy)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()), \
+                        contextlib.redirect_stderr(io.StringIO()):
+                    wiki_stats.go_to_wiki(
+                        'Base', 'en', os.path.join(work_dir, 'links.txt'),
+                        os.path.join(work_dir, 'nearest.txt'), concurrency,
+                        fetcher, backend)
+            finally:
+                fetcher.close()
+            with open(os.path.join(work_dir, 'nearest.txt'),
+                      encoding='utf-8') as f:
+                return f.read()
+
+    def test_same_nearest(self) -> None:
+        for concurrency in (1, 4):
+            with self.subTest(concurrency=concurrency):
+                html = self.nearest('html', concurrency)
+                self.assertEqual(html, self.nearest('api', concurrency))
+                # Все страницы всех категорий, включая перенаправление
+                self.assertEqual(len(html.splitlines()), len(
+                    set().union(*(MEMBERS[category]
+                                  for category in PAGES['Base']))))
+
+    def test_redirect_gets_target_categories(self) -> None:
+        lines = self.nearest('api', 1).splitlines()
+        alias, = [line for line in lines if line.startswith("('Alias 5'")]
+        target, = [line for line in lines if line.startswith("('Page 5'")]
+        self.assertEqual(alias.replace('Alias 5', 'Page 5'), target)
+
+    def test_resume_from_stream(self) -> None:
+        with tempfile.TemporaryDirectory() as work_dir:
+            nearest_file = os.path.join(work_dir, 'nearest.txt')
+            fetcher = wiki_stats.Fetcher(proxy=self.proxy)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()), \
+                        contextlib.redirect_stderr(io.StringIO()):
+                    wiki_stats.go_to_wiki(
+                        'Base', 'en', os.path.join(work_dir, 'links.txt'),
+                        nearest_file, 1, fetcher, 'api')
+                    with open(nearest_file, encoding='utf-8') as f:
+                        first = f.read()
+                    with open(f'{nearest_file}.checkpoint.json',
+                              encoding='utf-8') as f:
+                        self.assertNotIn('visited', json.load(f))
+                    # Все соседи уже в потоковом файле, повторно не оцениваются
+                    wiki_stats.go_to_wiki(
+                        'Base', 'en', os.path.join(work_dir, 'links.txt'),
+                        nearest_file, 1, fetcher, 'api', resume=True)
+            finally:
+                fetcher.close()
+            with open(nearest_file, encoding='utf-8') as f:
+                self.assertEqual(f.read(), first)
+            with open(f'{nearest_file}.jsonl', encoding='utf-8') as f:
+                self.assertEqual(len(f.readlines()), len(first.splitlines()))
+
+    def test_batch_lists_missing_page(self) -> None:
+        fetcher = wiki_stats.Fetcher(proxy=self.proxy)
+        with tempfile.TemporaryDirectory() as work_dir:
+            try:
+                with contextlib.redirect_stdout(io.StringIO()), \
+                        contextlib.redirect_stderr(io.StringIO()):
+                    wiki_stats.run_batch([('Base', 'en'), ('Missing', 'en')],
+                                         work_dir, 1, fetcher, 'api',
+                                         processes=1)
+            finally:
+                fetcher.close()
+            # Ответ 404 не исключение, но статья все равно не обработана
+            with open(os.path.join(work_dir, 'failed.tsv'),
+                      encoding='utf-8') as f:
+                self.assertEqual(f.read(), 'Missing\ten\n')
+            self.assertTrue(os.path.exists(
+                os.path.join(work_dir, 'en_Base_nearest.txt')))
+
+    def test_red_linked_category(self) -> None:
+        fetcher = wiki_stats.Fetcher(proxy=self.proxy)
+        try:
+            backend = wiki_stats.ApiBackend(fetcher, 'en')
+            # У категории без страницы описания ссылка ведет на ее создание
+            members, cursor = backend.list_category(
+                'Cat3', 'http://en.wikipedia.org/w/index.php?'
+                        'title=Category:Cat3&action=edit&redlink=1', None)
+            self.assertEqual([title for title, _ in members],
+                             MEMBERS['Cat3'][:API_LIMIT])
+            self.assertIsNotNone(cursor)
+            self.assertEqual(backend.list_category(
+                'Cat3', 'http://en.wikipedia.org/w/index.php', None),
+                ([], None))
+        finally:
+            fetcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
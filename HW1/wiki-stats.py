@@ -1,18 +1,90 @@
 import argparse
+import asyncio
+import base64
+import bisect
+import contextlib
+import cProfile
+import heapq
+import itertools
+import json
+import os
+import pstats
 import random
 import re
-from time import sleep
-from bs4 import BeautifulSoup
+import sqlite3
+import threading
+import time
+import typing as tp
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor, \
+    ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import parse_qs, unquote, urldefrag, urlsplit
+from bs4 import BeautifulSoup, SoupStrainer
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import DEFAULT_ACCEPT_ENCODING
 from tqdm.auto import tqdm
 
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
 
-def compute_pause(pause: str) -> float:
+# Словарь для хранения названий категории, характерной
+# для всех "плохих" страниц
+DISAMBIGUATION_CATEGORIES: dict[str, str] = {
+    'en': 'Disambiguation pages', 'ru': 'Страницы значений',
+    'fr': 'Homonymie', 'pt': 'Desambiguação', 'de': 'Begriffsklärung',
+    'es': 'Desambiguación', 'it': 'Pagine di disambiguazione', 'zh': '消歧义'}
+# Опять же создаем словарь, в котором храним названия шапки модуля,
+# где хранятся внешние ссылки на разных языках
+EXTERNAL_LINKS_HEADERS: dict[str, str] = {
+    'en': 'External_links', 'ru': 'Ссылки', 'de': 'Weblinks',
+    'es': 'Enlaces_externos', 'it': 'Collegamenti_esterni',
+    'fr': 'Liens_externes', 'pt': 'Ligações_externas',
+    'nl': 'Externe_links', 'hi': 'सन्दर्भ', 'zh': '外部連接'}
+
+
+class PausePolicy:
+    """
+    Pause strategy chosen by the user: a fixed pause, a uniformly or a
+    normally distributed one. A new pause is drawn for every request
+    """
+    def __init__(self, strategy: str, *params: float):
+        self.strategy = strategy
+        self.params = params
+
+    @property
+    def mean(self) -> float:
+        """
+        Mean duration of the pause
+        :return: mean of the distribution in seconds
+        """
+        if self.strategy == 'uniform':
+            return sum(self.params) / 2
+        return self.params[0]
+
+    def sample(self) -> float:
+        """
+        Draws the duration of the next pause
+        :return: duration of the pause in seconds
+        """
+        if self.strategy == 'gauss':
+            return abs(random.gauss(*self.params))
+        if self.strategy == 'uniform':
+            return random.uniform(*self.params)
+        return self.params[0]
+
+
+def compute_pause(pause: str) -> PausePolicy:
     """
     Calculation of the pause duration taking into account the strategy chosen
     by the user.
     :param pause: pause calculation strategy and numerical characteristics.
-    :return: duration of the pause.
+    :return: the strategy drawing durations of the pause.
     """
     if 'gauss' in pause:  # Обработка нормального распределения
         params_gauss = re.split('[:/]', pause)
@@ -21,7 +93,7 @@ def compute_pause(pause: str) -> float:
         mean_sec = to_sec(mean)
         if sigma < 0:
             raise argparse.ArgumentTypeError('Sigma should be a positive')
-        return abs(random.gauss(mean_sec, sigma))
+        return PausePolicy('gauss', mean_sec, sigma)
     elif '-' in pause:  # Обработка равномерного распределения
         if '-' == pause[0] or '' in pause.split('-'):
             raise argparse.ArgumentTypeError('Time should be a positive value')
@@ -31,9 +103,9 @@ def compute_pause(pause: str) -> float:
         if left_sec > right_sec:
             raise argparse.ArgumentTypeError('The left border must be less '
                                              'than or equal to the right')
-        return random.uniform(left_sec, right_sec)
+        return PausePolicy('uniform', left_sec, right_sec)
     else:  # Обработка дискретной паузы
-        return to_sec(pause)
+        return PausePolicy('fixed', to_sec(pause))
 
 
 def to_sec(time: str) -> float:
@@ -57,226 +129,1872 @@ def to_sec(time: str) -> float:
         return ml_sec / 1000
 
 
+def to_positive_int(value: str) -> int:
+    """
+    Auxiliary function for the integer arguments (number of simultaneous
+    requests, number of neighbours, etc.)
+    :param value: the string given by the user
+    :return: the positive integer
+    """
+    if (number := int(value)) < 1:
+        raise argparse.ArgumentTypeError('Value should be a positive integer')
+    return number
+
+
+def to_non_negative_int(value: str) -> int:
+    """
+    Auxiliary function for the integer arguments that may be zero (number of
+    retries)
+    :param value: the string given by the user
+    :return: the non-negative integer
+    """
+    if (number := int(value)) < 0:
+        raise argparse.ArgumentTypeError('Value should be a non-negative '
+                                         'integer')
+    return number
+
+
+def to_positive_float(value: str) -> float:
+    """
+    Auxiliary function for the real arguments (rate of requests)
+    :param value: the string given by the user
+    :return: the positive finite number
+    """
+    if not 0 < (number := float(value)) < float('inf'):
+        raise argparse.ArgumentTypeError('Value should be a positive number')
+    return number
+
+
+class PageCache:
+    """
+    Persistent cache of wiki pages keyed by language and URL. Bodies are
+    stored zlib-compressed in SQLite together with ETag/Last-Modified for
+    revalidation; the least recently used pages are evicted once the total
+    size of the bodies exceeds max_size bytes
+    """
+    def __init__(self, cache_dir: str, max_size: int = 500 * 2 ** 20,
+                 ttl: float = 24 * 3600):
+        os.makedirs(cache_dir, exist_ok=True)
+        self._max_size = max_size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(cache_dir, 'pages.sqlite'), isolation_level=None,
+            check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS pages (lang TEXT, url TEXT, '
+            'etag TEXT, last_modified TEXT, content_type TEXT, body BLOB, '
+            'size INTEGER, fetched_at REAL, accessed_at REAL, '
+            'PRIMARY KEY (lang, url))')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS pages_lru '
+                                 'ON pages (accessed_at)')
+        # Результаты проверки ссылок со страниц значений
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS links (lang TEXT, title TEXT, '
+            'informative INTEGER, checked_at REAL, '
+            'PRIMARY KEY (lang, title))')
+        self._size = self._connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+
+    @staticmethod
+    def _key(url: str) -> tuple[str, str]:
+        """
+        Auxiliary function for the cache key: the national wiki section is
+        taken from the host name ({lang}.wikipedia.org)
+        :param url: the requested address
+        :return: (lang, url)
+        """
+        return (urlsplit(url).hostname or '').split('.')[0], url
+
+    def get(self, url: str) -> tuple[requests.Response, bool] | None:
+        """
+        Looks for the page in the cache
+        :param url: the requested address
+        :return: None if the page is not cached, otherwise the restored
+        response and True if it is younger than ttl
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT etag, last_modified, content_type, body, fetched_at '
+                'FROM pages WHERE lang = ? AND url = ?',
+                self._key(url)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                'UPDATE pages SET accessed_at = ? WHERE lang = ? AND url = ?',
+                (time.time(), *self._key(url)))
+        etag, last_modified, content_type, body, fetched_at = row
+        response = requests.Response()
+        response.status_code = requests.codes['ok']
+        response.reason = 'OK'
+        response.url = url
+        response._content = zlib.decompress(body)
+        response.headers = CaseInsensitiveDict(
+            {name: value for name, value in (('ETag', etag),
+                                             ('Last-Modified', last_modified),
+                                             ('Content-Type', content_type))
+             if value})
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers)
+        return response, time.time() - fetched_at < self._ttl
+
+    def put(self, url: str, response: requests.Response) -> None:
+        """
+        Saves a successful response and evicts the least recently used pages
+        if the cache became too large
+        :param url: the requested address (before redirects)
+        :param response: response to a request from the wiki
+        :return: None
+        """
+        body = zlib.compress(response.content)
+        now = time.time()
+        with self._lock:
+            old = self._connection.execute(
+                'SELECT size FROM pages WHERE lang = ? AND url = ?',
+                self._key(url)).fetchone()
+            self._connection.execute(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, '
+                '?)', (*self._key(url), response.headers.get('ETag'),
+                       response.headers.get('Last-Modified'),
+                       response.headers.get('Content-Type'), body, len(body),
+                       now, now))
+            self._size += len(body) - (old[0] if old else 0)
+            while self._size > self._max_size:
+                lang, url, size = self._connection.execute(
+                    'SELECT lang, url, size FROM pages '
+                    'ORDER BY accessed_at LIMIT 1').fetchone()
+                self._connection.execute(
+                    'DELETE FROM pages WHERE lang = ? AND url = ?',
+                    (lang, url))
+                self._size -= size
+
+    def touch(self, url: str) -> None:
+        """
+        Marks the page as fresh after the server confirmed (304) that it has
+        not changed
+        :param url: the requested address
+        :return: None
+        """
+        with self._lock:
+            self._connection.execute(
+                'UPDATE pages SET fetched_at = ? WHERE lang = ? AND url = ?',
+                (time.time(), *self._key(url)))
+
+    def get_link(self, lang: str, title: str) -> bool | None:
+        """
+        Looks for the result of checking a link from a disambiguation page
+        :param lang: National Wiki Section
+        :param title: the title of the linked page
+        :return: None if the link was not checked or the result is older than
+        ttl, otherwise True if the page is informative
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT informative, checked_at FROM links '
+                'WHERE lang = ? AND title = ?', (lang, title)).fetchone()
+        if row is None or time.time() - row[1] >= self._ttl:
+            return None
+        return bool(row[0])
+
+    def put_link(self, lang: str, title: str, informative: bool) -> None:
+        """
+        Saves the result of checking a link from a disambiguation page
+        :param lang: National Wiki Section
+        :param title: the title of the linked page
+        :param informative: True if the page has categories and is not a
+        disambiguation page itself
+        :return: None
+        """
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?)',
+                (lang, title, informative, time.time()))
+
+    def close(self) -> None:
+        """
+        Closes the cache database
+        :return: None
+        """
+        self._connection.close()
+
+
+class CategoryIndex:
+    """
+    Persistent SQLite index of the wiki per language: title -> categories of
+    the page and category -> pages of the category. Entries younger than ttl
+    are answered locally, older ones are refetched and replaced one by one
+    """
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, isolation_level=None,
+                                           check_same_thread=False)
+        for statement in (
+                'CREATE TABLE IF NOT EXISTS titles (lang TEXT, title TEXT, '
+                'refreshed_at REAL, PRIMARY KEY (lang, title))',
+                'CREATE TABLE IF NOT EXISTS title_categories (lang TEXT, '
+                'title TEXT, category TEXT, '
+                'PRIMARY KEY (lang, title, category))',
+                'CREATE INDEX IF NOT EXISTS title_categories_by_category '
+                'ON title_categories (lang, category)',
+                # refreshed_at пуст, пока список категории читается
+                'CREATE TABLE IF NOT EXISTS categories (lang TEXT, '
+                'link TEXT, refreshed_at REAL, PRIMARY KEY (lang, link))',
+                'CREATE TABLE IF NOT EXISTS category_members (lang TEXT, '
+                'link TEXT, position INTEGER, title TEXT, member_link TEXT, '
+                'PRIMARY KEY (lang, link, position))'):
+            self._connection.execute(statement)
+
+    def get_members(self, lang: str, link: str) \
+            -> list[tuple[str, str]] | None:
+        """
+        The pages of a category if its full list is fresh
+        :param lang: National Wiki Section
+        :param link: link to the category
+        :return: list of (title, link) of the pages (None if the list is not
+        in the index, incomplete or stale)
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT refreshed_at FROM categories '
+                'WHERE lang = ? AND link = ?', (lang, link)).fetchone()
+            if row is None or row[0] is None or \
+                    time.time() - row[0] >= self._ttl:
+                return None
+            return self._connection.execute(
+                'SELECT title, member_link FROM category_members '
+                'WHERE lang = ? AND link = ? ORDER BY position',
+                (lang, link)).fetchall()
+
+    def put_members(self, lang: str, link: str,
+                    members: list[tuple[str, str]], first: bool,
+                    last: bool) -> None:
+        """
+        Saves one portion of the list of the pages in a category
+        :param lang: National Wiki Section
+        :param link: link to the category
+        :param members: list of (title, link) of the pages of the portion
+        :param first: the portion is the first one (the old list is dropped)
+        :param last: the portion is the last one (the list becomes fresh)
+        :return: None
+        """
+        with self._lock:
+            if first:
+                self._connection.execute(
+                    'DELETE FROM category_members WHERE lang = ? AND link = ?',
+                    (lang, link))
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO categories VALUES (?, ?, NULL)',
+                    (lang, link))
+            else:
+                row = self._connection.execute(
+                    'SELECT refreshed_at FROM categories '
+                    'WHERE lang = ? AND link = ?', (lang, link)).fetchone()
+                # Продолжение списка, начало которого в индекс не попало
+                # (например, после возобновления обхода): без начала список
+                # неполон, и свежим его считать нельзя
+                if row is None or row[0] is not None:
+                    return
+            start = self._connection.execute(
+                'SELECT COUNT(*) FROM category_members '
+                'WHERE lang = ? AND link = ?', (lang, link)).fetchone()[0]
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO category_members '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(lang, link, start + position, title, member_link)
+                 for position, (title, member_link) in enumerate(members)])
+            if last:
+                self._connection.execute(
+                    'UPDATE categories SET refreshed_at = ? '
+                    'WHERE lang = ? AND link = ?', (time.time(), lang, link))
+
+    def get_categories(self, lang: str, titles: list[str]) \
+            -> dict[str, set[str]]:
+        """
+        The categories of the pages with fresh entries
+        :param lang: National Wiki Section
+        :param titles: titles of the pages
+        :return: dictionary title -> set of the category names (stale and
+        unknown pages are absent)
+        """
+        placeholders = ', '.join('?' * len(titles))
+        with self._lock:
+            fresh = self._connection.execute(
+                'SELECT title FROM titles '
+                'WHERE lang = ? AND refreshed_at > ? '
+                f'AND title IN ({placeholders})',
+                (lang, time.time() - self._ttl, *titles)).fetchall()
+            categories: dict[str, set[str]] = {title: set()
+                                               for title, in fresh}
+            for title, category in self._connection.execute(
+                    'SELECT title, category FROM title_categories '
+                    f'WHERE lang = ? AND title IN ({placeholders})',
+                    (lang, *titles)):
+                if title in categories:
+                    categories[title].add(category)
+        return categories
+
+    def put_categories(self, lang: str,
+                       categories: dict[str, set[str]]) -> None:
+        """
+        Replaces the categories of the pages
+        :param lang: National Wiki Section
+        :param categories: dictionary title -> set of the category names
+        :return: None
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                'DELETE FROM title_categories WHERE lang = ? AND title = ?',
+                [(lang, title) for title in categories])
+            self._connection.executemany(
+                'INSERT INTO title_categories VALUES (?, ?, ?)',
+                [(lang, title, category)
+                 for title, names in categories.items() for category in names])
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO titles VALUES (?, ?, ?)',
+                [(lang, title, now) for title in categories])
+
+    def close(self) -> None:
+        """
+        Closes the index database
+        :return: None
+        """
+        self._connection.close()
+
+
+class FixtureRecorder:
+    """
+    Records the responses received from the network to a JSONL file of
+    fixtures (one response per line: url, status, headers and the body in
+    base64), which replay_server.py serves back without the network
+    """
+    headers = ('Content-Type', 'ETag', 'Last-Modified')
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._file = open(path, mode='a', encoding='utf-8')
+
+    def save(self, response: requests.Response) -> None:
+        """
+        Appends one response to the fixtures
+        :param response: response to a request from the wiki
+        :return: None
+        """
+        # Ключ - адрес исходного запроса, а не адрес после перенаправлений,
+        # и без якоря, который на сервер не отправляется
+        request = (response.history[0] if response.history
+                   else response).request
+        record = json.dumps({
+            'url': urldefrag(request.url).url, 'status': response.status_code,
+            'headers': {name: response.headers[name] for name in self.headers
+                        if name in response.headers},
+            'body': base64.b64encode(response.content).decode('ascii')})
+        with self._lock:
+            print(record, file=self._file, flush=True)
+
+    def close(self) -> None:
+        """
+        Closes the file of fixtures
+        :return: None
+        """
+        self._file.close()
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets (as in Prometheus:
+    the count of every bucket includes the smaller ones)
+    """
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Adds one value
+        :param value: the observed value
+        :return: None
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def report(self) -> dict:
+        """
+        The distribution for the report
+        :return: count, sum and cumulative counts of the buckets
+        """
+        cumulative = [*itertools.accumulate(self.counts)]
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': {**{str(le): n for le, n
+                               in zip(self.buckets, cumulative)},
+                            '+Inf': cumulative[-1]}}
+
+
+class Metrics:
+    """
+    Counters and histograms of a run shared by all threads: fetch latency,
+    parse time, bytes (on the wire and decoded), cache hits, retries,
+    throttling and items per category. Timed sections (fetch and parse) call
+    the profiling hooks: every hook is called with the name of the section
+    and returns a context manager wrapped around it
+    """
+    buckets: dict[str, tuple[float, ...]] = {
+        'fetch_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                          5, 10),
+        'parse_seconds': (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                          0.1, 0.25, 0.5, 1),
+        'category_items': (1, 10, 50, 100, 200, 500, 1000, 5000, 10000)}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self.counters: dict[str, float] = dict.fromkeys((
+            'requests', 'retries', 'throttled', 'connection_errors',
+            'http_errors', 'bytes', 'decoded_bytes', 'throttle_seconds',
+            'cache_hits', 'cache_revalidated', 'cache_misses'), 0)
+        self.histograms: dict[str, Histogram] = {
+            name: Histogram(buckets) for name, buckets in self.buckets.items()}
+        self.category_items: dict[str, int] = {}
+        self.hooks: list[tp.Callable[[str], tp.ContextManager]] = []
+
+    def count(self, name: str, value: float = 1) -> None:
+        """
+        Increases a counter
+        :param name: the name of the counter
+        :param value: the increment
+        :return: None
+        """
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Adds a value to a histogram
+        :param name: the name of the histogram
+        :param value: the observed value
+        :return: None
+        """
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    def add_category(self, name: str, items: int) -> None:
+        """
+        Records the number of pages listed in a category
+        :param name: the name of the category
+        :param items: number of the pages
+        :return: None
+        """
+        with self._lock:
+            self.category_items[name] = items
+            self.histograms['category_items'].observe(items)
+
+    @contextlib.contextmanager
+    def timer(self, section: str) -> tp.Iterator[None]:
+        """
+        Measures a section of the hot path ('fetch' or 'parse') into the
+        histogram {section}_seconds; the section runs inside the hooks
+        :param section: the name of the section
+        :return: context manager
+        """
+        with contextlib.ExitStack() as stack:
+            for hook in self.hooks:
+                stack.enter_context(hook(section))
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe(f'{section}_seconds',
+                             time.perf_counter() - start)
+
+    def report(self) -> dict:
+        """
+        All metrics as one dictionary
+        :return: the report
+        """
+        with self._lock:
+            cache = (self.counters['cache_hits']
+                     + self.counters['cache_revalidated'])
+            lookups = cache + self.counters['cache_misses']
+            return {'elapsed_seconds': time.monotonic() - self._start,
+                    'counters': dict(self.counters),
+                    'cache_hit_rate': cache / lookups if lookups else None,
+                    'histograms': {name: histogram.report() for name,
+                                   histogram in self.histograms.items()},
+                    'category_items': dict(self.category_items)}
+
+    def to_prometheus(self) -> str:
+        """
+        The report in the Prometheus text format
+        :return: text of the report
+        """
+        report = self.report()
+        lines = ['# TYPE wiki_stats_elapsed_seconds gauge',
+                 f'wiki_stats_elapsed_seconds {report["elapsed_seconds"]}']
+        for name, value in report['counters'].items():
+            lines += [f'# TYPE wiki_stats_{name}_total counter',
+                      f'wiki_stats_{name}_total {value}']
+        if report['cache_hit_rate'] is not None:
+            lines += ['# TYPE wiki_stats_cache_hit_rate gauge',
+                      f'wiki_stats_cache_hit_rate {report["cache_hit_rate"]}']
+        for name, histogram in report['histograms'].items():
+            lines.append(f'# TYPE wiki_stats_{name} histogram')
+            lines += [f'wiki_stats_{name}_bucket{{le="{le}"}} {n}'
+                      for le, n in histogram['buckets'].items()]
+            lines += [f'wiki_stats_{name}_sum {histogram["sum"]}',
+                      f'wiki_stats_{name}_count {histogram["count"]}']
+        lines.append('# TYPE wiki_stats_category_items_listed gauge')
+        for name, items in report['category_items'].items():
+            # Кавычки и обратные косые черты в значениях меток экранируются
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(
+                f'wiki_stats_category_items_listed{{category="{label}"}} '
+                f'{items}')
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path: str, form: str = 'json') -> None:
+        """
+        Writes the report to a file
+        :param path: the name of the file
+        :param form: 'json' or 'prometheus'
+        :return: None
+        """
+        with open(path, mode='w', encoding='utf-8') as f:
+            if form == 'prometheus':
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+class ProfileHook:
+    """
+    Profiling hook of Metrics: the timed sections are run under cProfile and
+    their statistics are merged into one file readable by pstats. A section
+    that cannot be profiled (another profiler is active in the thread) is
+    just run
+    """
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._stats: pstats.Stats | None = None
+
+    @contextlib.contextmanager
+    def __call__(self, section: str) -> tp.Iterator[None]:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    def save(self) -> None:
+        """
+        Writes the merged statistics
+        :return: None
+        """
+        with self._lock:
+            if self._stats is not None:
+                self._stats.dump_stats(self._path)
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the requests to one host, shared by all threads.
+    Tokens arrive at the current rate and up to burst of them are stored.
+    On 429/503 the rate is halved and the host is paused for Retry-After;
+    every healthy answer brings the rate back towards the target. The
+    intervals between tokens are drawn from the pause policy, which is only
+    scaled to the current rate
+    """
+    min_share = 1 / 32
+
+    def __init__(self, rate: float, burst: int = 1,
+                 jitter: PausePolicy | None = None):
+        self._target = rate
+        self._rate = rate
+        self._burst = burst
+        self._jitter = jitter
+        self._lock = threading.Lock()
+        # Теоретическое время выдачи следующего жетона (алгоритм GCRA)
+        self._next_token = 0.0
+        self._blocked_until = 0.0
+
+    @property
+    def rate(self) -> float:
+        """
+        Current rate of the bucket
+        :return: requests per second
+        """
+        return self._rate
+
+    def acquire(self) -> float:
+        """
+        Blocks the calling thread until a request to the host is allowed
+        :return: time in seconds the thread waited
+        """
+        with self._lock:
+            interval = 1 / self._rate
+            if self._jitter is not None:
+                interval *= self._jitter.sample() / self._jitter.mean
+            now = time.monotonic()
+            start = max(now, self._blocked_until,
+                        self._next_token - (self._burst - 1) / self._rate)
+            self._next_token = max(self._next_token, start) + interval
+        if (delay := start - now) > 0:
+            time.sleep(delay)
+        return max(delay, 0.0)
+
+    def slow_down(self, delay: float = 0.0) -> None:
+        """
+        Reaction to 429/503: halves the rate and pauses the host
+        :param delay: time in seconds during which the host is not asked
+        :return: None
+        """
+        with self._lock:
+            self._rate = max(self._rate / 2, self._target * self.min_share)
+            self._blocked_until = max(self._blocked_until,
+                                      time.monotonic() + delay)
+
+    def speed_up(self) -> None:
+        """
+        Reaction to a healthy answer: the rate grows back to the target
+        :return: None
+        """
+        with self._lock:
+            self._rate = min(self._target, self._rate + self._target / 10)
+
+
+class Fetcher:
+    """
+    One pooled HTTP session shared by all requests to the wiki: connections
+    are kept alive and reused, responses are compressed (gzip/deflate and br
+    when brotli is installed), transient errors are retried with exponential
+    backoff honoring Retry-After. Requests to every host go through its own
+    adaptive token bucket (no limit if neither rate nor pause is given).
+    With a cache, fresh pages are served from
+    disk and stale ones are revalidated with If-None-Match/If-Modified-Since;
+    in offline mode the network is never used. Requests, retries, bytes,
+    latency and cache hits are counted in the metrics of the fetcher
+    """
+    retry_statuses = frozenset((429, 500, 502, 503, 504))
+
+    def __init__(self, timeout: float = 10.0, retries: int = 3,
+                 backoff: float = 0.5, pool_size: int = 10,
+                 cache: PageCache | None = None, offline: bool = False,
+                 rate: float | None = None, burst: int = 1,
+                 pause: PausePolicy | None = None,
+                 recorder: FixtureRecorder | None = None,
+                 proxy: str | None = None,
+                 metrics: Metrics | None = None):
+        # Без попыток запрос не отправлялся бы вовсе
+        if retries < 0:
+            raise ValueError('retries should be a non-negative integer')
+        # При нулевой или отрицательной частоте интервал между жетонами не
+        # определен
+        if rate is not None and not rate > 0:
+            raise ValueError('rate should be a positive number')
+        self._cache = cache
+        self._metrics = metrics or Metrics()
+        self._recorder = recorder
+        # Если частота не задана, ее задает средняя пауза
+        self._rate = rate if rate is not None else (
+            1 / pause.mean if pause else None)
+        self._burst = burst
+        self._pause = pause
+        self._buckets: dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+        self._offline = offline
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._session.headers.update({
+            'Accept-Encoding': DEFAULT_ACCEPT_ENCODING,
+            'User-Agent': 'wiki-stats/1.0 (Python_HSE; python-requests)'})
+        if proxy:
+            self._session.proxies.update({'http': proxy, 'https': proxy})
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        GET request through the cache (if there is one)
+        :param url: the requested address
+        :param kwargs: additional arguments of requests.Session.get
+        :return: response from the cache or from the wiki
+        """
+        if self._cache is None:
+            return self._request(url, **kwargs)
+        # Ключ кэша - полный адрес вместе с параметрами запроса
+        url = requests.Request('GET', url,
+                               params=kwargs.pop('params', None)).prepare().url
+        cached = self._cache.get(url)
+        if cached is not None and (cached[1] or self._offline):
+            self._metrics.count('cache_hits')
+            return cached[0]
+        if self._offline:
+            self._metrics.count('cache_misses')
+            response = requests.Response()
+            response.status_code = 504
+            response.reason = 'Not in cache (offline mode)'
+            response.url = url
+            response._content = b''
+            return response
+        if cached is not None:
+            headers = dict(kwargs.pop('headers', None) or {})
+            if etag := cached[0].headers.get('ETag'):
+                headers['If-None-Match'] = etag
+            if last_modified := cached[0].headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = last_modified
+            kwargs['headers'] = headers
+        response = self._request(url, **kwargs)
+        if (cached is not None
+                and response.status_code == requests.codes['not_modified']):
+            self._metrics.count('cache_revalidated')
+            self._cache.touch(url)
+            return cached[0]
+        self._metrics.count('cache_misses')
+        if response.status_code == requests.codes['ok']:
+            self._cache.put(url, response)
+        return response
+
+    def _request(self, url: str, **kwargs) -> requests.Response:
+        """
+        Request to the network, the response is recorded to the fixtures if
+        there is a recorder
+        :param url: the requested address
+        :param kwargs: additional arguments of requests.Session.get
+        :return: response of the last attempt
+        """
+        response = self._send(url, **kwargs)
+        if self._recorder is not None and \
+                response.status_code != requests.codes['not_modified']:
+            self._recorder.save(response)
+        return response
+
+    def _send(self, url: str, **kwargs) -> requests.Response:
+        """
+        GET request with retries of timeouts, broken connections and
+        429/5xx answers
+        :param url: the requested address
+        :param kwargs: additional arguments of requests.Session.get
+        :return: response of the last attempt
+        """
+        kwargs.setdefault('timeout', self._timeout)
+        bucket = self._bucket(url)
+        metrics = self._metrics
+        for attempt in range(self._retries + 1):
+            if attempt:
+                metrics.count('retries')
+            if bucket is not None:
+                metrics.count('throttle_seconds', bucket.acquire())
+            metrics.count('requests')
+            try:
+                with metrics.timer('fetch'):
+                    response = self._session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout):
+                metrics.count('connection_errors')
+                if attempt == self._retries:
+                    raise
+                time.sleep(self._backoff * 2 ** attempt)
+                continue
+            metrics.count('bytes', self._wire_size(response))
+            metrics.count('decoded_bytes', len(response.content))
+            if response.status_code >= 400:
+                metrics.count('http_errors')
+            throttled = response.status_code in (
+                requests.codes['too_many_requests'],
+                requests.codes['service_unavailable'])
+            if throttled:
+                metrics.count('throttled')
+            if bucket is not None:
+                if throttled:
+                    # Пауза после отказа выдерживается самим ведром хоста
+                    bucket.slow_down(self._retry_delay(response, attempt))
+                elif response.status_code < 500:
+                    bucket.speed_up()
+            if (response.status_code not in self.retry_statuses
+                    or attempt == self._retries):
+                return response
+            if bucket is None or not throttled:
+                time.sleep(self._retry_delay(response, attempt))
+        return response
+
+    def _bucket(self, url: str) -> TokenBucket | None:
+        """
+        Auxiliary function for the token bucket of the host of the address
+        :param url: the requested address
+        :return: the bucket (None if requests are not limited)
+        """
+        if self._rate is None:
+            return None
+        host = urlsplit(url).hostname or ''
+        with self._buckets_lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self._rate, self._burst,
+                                                  self._pause)
+            return self._buckets[host]
+
+    @staticmethod
+    def _wire_size(response: requests.Response) -> int:
+        """
+        Size of the body as it was transferred, before gzip/deflate decoding
+        :param response: received response
+        :return: Content-Length if the server sent it, otherwise the number
+        of bytes read from the connection
+        """
+        length = response.headers.get('Content-Length', '')
+        if length.isdigit():
+            return int(length)
+        if response.raw is not None and hasattr(response.raw, 'tell'):
+            return response.raw.tell()
+        return len(response.content)
+
+    def _retry_delay(self, response: requests.Response, attempt: int) \
+            -> float:
+        """
+        Pause before the next attempt: Retry-After if the server sent it,
+        otherwise exponential backoff
+        :param response: rejected response
+        :param attempt: number of the failed attempt (from 0)
+        :return: duration of the pause in seconds
+        """
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            # Retry-After задается либо числом секунд, либо HTTP-датой
+            if retry_after.isdigit():
+                return float(retry_after)
+            try:
+                date = parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                pass
+            else:
+                return max(0.0, date.timestamp() - time.time())
+        return self._backoff * 2 ** attempt
+
+    def close(self) -> None:
+        """
+        Closes all pooled connections, the cache and the fixtures
+        :return: None
+        """
+        self._session.close()
+        if self._cache is not None:
+            self._cache.close()
+        if self._recorder is not None:
+            self._recorder.close()
+
+    @property
+    def cache(self) -> PageCache | None:
+        """
+        The page cache of the fetcher
+        :return: the cache (None if the pages are not cached)
+        """
+        return self._cache
+
+    @property
+    def metrics(self) -> Metrics:
+        """
+        The metrics of the requests made by the fetcher
+        :return: the metrics
+        """
+        return self._metrics
+
+
 def go_to_wiki(page: str, lang: str, links_file: str, nearest_file: str,
-               pause: str) -> None:
+               concurrency: int = 1,
+               fetcher: Fetcher | None = None,
+               backend: 'str | Backend' = 'html', top: int | None = None,
+               resume: bool = False) -> bool:
     """
     On request, it finds a wiki page, checks the correctness of the request
     and accesses functions get_external_links, information_pages_test,
     get_category_neighbours if necessary
-    :param pause: Time of the pause
     :param page: request
     :param lang: National Wiki Section
     :param links_file: file for external links
     :param nearest_file: file for category neighbors
-
-    :return: None
+    :param concurrency: number of simultaneous requests to the wiki
+    :param fetcher: shared HTTP session (a new one if None)
+    :param backend: the way neighbours are found ('html', 'api' or a ready
+    backend object)
+    :param top: write only the top best neighbours (all if None)
+    :param resume: continue the crawl from the last checkpoint
+    :return: True if the page was received, False if it was not found or
+    the request failed (the reason is printed)
     """
+    fetcher = fetcher or Fetcher(pool_size=concurrency)
     url = f'http://{lang}.wikipedia.org/wiki/{page}'
     try:
-        resp = requests.get(url)
+        resp = fetcher.get(url)
         # Ошибка, если неправильный национальный раздел вики
         # или в случае, если нет интернета, но здесь ничего не поделать
     except requests.exceptions.ConnectionError:
         print('Wrong national wiki section!')
+        return False
+    if resp.status_code == requests.codes['ok']:
+        print(f'Successful request {url}')
+        with fetcher.metrics.timer('parse'):
+            wiki_page = WikiPage(resp, lang)
+        desambig = information_pages_test(wiki_page, page, lang, fetcher,
+                                          concurrency)
+        if desambig:
+            get_external_links(wiki_page, lang, links_file)
+            get_category_neighbours(wiki_page, lang, nearest_file,
+                                    concurrency, fetcher, backend, top,
+                                    resume)
+        return True
+    if resp.status_code == requests.codes['not_found']:
+        print(f'The page on the link {url} was not found.'
+              f' Error {resp.status_code}.')
     else:
-        if resp.status_code == requests.codes['ok']:
-            print(f'Successful request {url}')
-            desambig = information_pages_test(resp, page, lang)
-            if desambig:
-                get_external_links(resp, lang, links_file)
-                get_category_neighbours(resp, lang, nearest_file, pause)
-        elif resp.status_code == requests.codes['not_found']:
-            print(f'The page on the link {url} was not found.'
-                  f' Error {resp.status_code}.')
-        else:
-            print(f'Mistake {resp.status_code} ({resp.reason}).'
-                  f' Request rejected')
+        print(f'Mistake {resp.status_code} ({resp.reason}).'
+              f' Request rejected')
+    return False
+
+
+class WikiPage:
+    """
+    A wiki page parsed once right after the download: its categories,
+    external links, links from the lists of the article and disambiguation
+    status are extracted together. Only the article body and the categories
+    block are parsed, the rest of the document is skipped
+    """
+    def __init__(self, response: requests.Response, lang: str):
+        categories = extract_categories(response.text)
+        self.category_names: list[str] = [name for name, _ in categories]
+        self.category_links: list[str] = [
+            f'http://{lang}.wikipedia.org{href}' for _, href in categories]
+        self.is_disambiguation = is_disambiguation(self.category_names, lang)
+        soup = BeautifulSoup(response.text, HTML_PARSER,
+                             parse_only=SoupStrainer(
+                                 'div',
+                                 class_=re.compile(r'\bmw-parser-output\b')))
+        self.external_links: list[str] = []
+        if (header := EXTERNAL_LINKS_HEADERS.get(lang)) and \
+                (external_tag := soup.find(id=header)):
+            external_header = external_tag.parent
+            for ul in external_header.find_next_siblings('ul'):
+                for a_tags in ul.find_all('a', class_='external text'):
+                    self.external_links.append(a_tags.get('href'))
+        # Ссылки из списков статьи, сразу откидываем не вики-страницы
+        self.list_links: list[str] = [
+            f'http://{lang}.wikipedia.org{tag_a.get("href")}'
+            for paragraph in soup.find_all('div', class_='mw-parser-output')
+            for value in paragraph.find_all('li')
+            for tag_a in value.find_all('a')
+            if tag_a.get('href', '')[:6] == '/wiki/']
+
+
+def extract_categories(html: str) -> list[tuple[str, str]]:
+    """
+    Targeted extraction of the categories of a page: only the
+    mw-normal-catlinks block is cut out of the text and parsed
+    :param html: text of the wiki page
+    :return: list of (name, href) of the categories (empty if there are none)
+    """
+    start = html.find('id="mw-normal-catlinks"')
+    if start == -1:
+        return []
+    start = html.rfind('<div', 0, start)
+    end = html.find('</div>', start)
+    soup = BeautifulSoup(html[start:end + len('</div>')], HTML_PARSER)
+    if (ul := soup.find('ul')) is None:
+        return []
+    return [(tag_a.text, tag_a.get('href')) for tag_a in ul.find_all('a')]
+
+
+def is_disambiguation(category_names: list[str], lang: str) -> bool:
+    """
+    Checks whether one of the categories marks a disambiguation page
+    :param category_names: names of the categories of the page
+    :param lang: National Wiki Section
+    :return: True if the page is a disambiguation page
+    """
+    name = DISAMBIGUATION_CATEGORIES.get(lang)
+    return name is not None and any(name in category
+                                    for category in category_names)
 
 
-def information_pages_test(response: requests.Response, page: str, lang: str) \
-        -> bool:
+def information_pages_test(wiki_page: WikiPage, page: str, lang: str,
+                           fetcher: Fetcher, concurrency: int = 1) -> bool:
     """
     Checks  the page is ambiguous. If yes, it displays all links on the screen
-    Checks the page is disambiguation page
-    :param response:
+    Checks the page is disambiguation page. The links are deduplicated before
+    any request and checked by concurrency threads
+    :param wiki_page: the parsed wiki page
     :param page: request
     :param lang: National Wiki Section
+    :param fetcher: shared HTTP session
+    :param concurrency: number of simultaneous requests to the wiki
     :return: True if disambiguous else False
     """
-    flag_page_is_disambig = True
-    # Словарь для хранения названий категории, характерной
-    # для всех "плохих" страниц
-    dict_names_page = {'en': 'Disambiguation pages', 'ru': 'Страницы значений',
-                       'fr': 'Homonymie', 'pt': 'Desambiguação',
-                       'de': 'Begriffsklärung', 'es': 'Desambiguación',
-                       'it': 'Pagine di disambiguazione', 'zh': '消歧义'}
-    soup = BeautifulSoup(response.text, 'html.parser')
-    category_a_tags = (soup.find('div', id='mw-normal-catlinks').
-                       find('ul').find_all('a'))
-    for a_tag in category_a_tags:
-        if dict_names_page[lang] in a_tag.text:
-            print('This page is ambiguous. All links to unambiguous '
-                  'wiki pages will be displayed below.')
-            flag_page_is_disambig = False
-            break
-    if not flag_page_is_disambig:
-        new_links: [str] = []
-        for paragraph in tqdm(soup.find_all(
-                'div', class_='mw-parser-output'),
-                position=0, colour='red'):
-            for value in tqdm(paragraph.find_all('li'),
-                              leave=False, position=1, colour='red'):
-                for tag_a in value.find_all('a'):
-                    # Сразу откидываем не вики-страницы
-                    if '/wiki/' == tag_a.get('href')[:6]:
-                        link = (f'http://{lang}.wikipedia.org'
-                                f'{tag_a.get("href")}')
-                        request = requests.get(link)
-                        soup_new_link = BeautifulSoup(request.text,
-                                                      'html.parser')
-                        new_link_have_categories = soup_new_link.find(
-                            'div', id='mw-normal-catlinks') \
-                            # Если страница вики и у нее нет категорий,
-                        # то это странная страница, нам такая не нужна
-                        if not new_link_have_categories:
-                            continue
-                        flag_ambig = False
-                        for a_tag in new_link_have_categories.find(
-                                'ul').find_all('a'):
-                            # Проверим, что ссылки на
-                            # не "неоднозначные" страницы
-                            if dict_names_page[lang] in a_tag.text:
-                                flag_ambig = True
-                                continue
-                        if flag_ambig:
-                            continue
-                        if link not in new_links:
-                            new_links.append(link)
-    if not flag_page_is_disambig:
-        print(*new_links, sep='\n')
-    return flag_page_is_disambig
-
-
-def get_external_links(response: requests.Response, lang: str,
+    if not wiki_page.is_disambiguation:
+        return True
+    print('This page is ambiguous. All links to unambiguous '
+          'wiki pages will be displayed below.')
+    # Повторы убираем до запросов, порядок ссылок сохраняется
+    links = [*dict.fromkeys(wiki_page.list_links)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        informative = [*tqdm(executor.map(
+            lambda link: is_informative_link(link, lang, fetcher), links),
+            total=len(links), position=0, colour='red')]
+    new_links = [link for link, flag in zip(links, informative) if flag]
+    print(*new_links, sep='\n')
+    return False
+
+
+def is_informative_link(link: str, lang: str, fetcher: Fetcher) -> bool:
+    """
+    Checks a link from a disambiguation page. The result is memoized per
+    title in the page cache (if there is one) across runs
+    :param link: link to the wiki page
+    :param lang: National Wiki Section
+    :param fetcher: shared HTTP session
+    :return: True if the page has categories and is not a disambiguation page
+    """
+    title = unquote(link.split('/wiki/', 1)[1])
+    if fetcher.cache is not None and \
+            (informative := fetcher.cache.get_link(lang, title)) is not None:
+        return informative
+    response = fetcher.get(link)
+    with fetcher.metrics.timer('parse'):
+        new_link_categories = [name for name, _ in
+                               extract_categories(response.text)]
+    # Если страница вики и у нее нет категорий,
+    # то это странная страница, нам такая не нужна.
+    # Проверим, что ссылки на не "неоднозначные" страницы
+    informative = bool(new_link_categories) and not is_disambiguation(
+        new_link_categories, lang)
+    if fetcher.cache is not None and \
+            response.status_code == requests.codes['ok']:
+        fetcher.cache.put_link(lang, title, informative)
+    return informative
+
+
+def get_external_links(wiki_page: WikiPage, lang: str,
                        links_file: str) -> None:
     """
     The function writes external links in links_file
-    :param response: response to a request from the wiki
+    :param wiki_page: the parsed wiki page
     :param lang: National Wiki Section
     :param links_file: the name of the file to write
     :return: None
     """
-    external_links_diff_lang: dict[str: str] = {'en': 'External_links',
-                                                'ru': 'Ссылки',
-                                                'de': 'Weblinks',
-                                                'es': 'Enlaces_externos',
-                                                'it': 'Collegamenti_esterni',
-                                                'fr': 'Liens_externes',
-                                                'pt': 'Ligações_externas',
-                                                'nl': 'Externe_links',
-                                                'hi': 'सन्दर्भ',
-                                                'zh': '外部連接'}
-    # Опять же создаем словарь, в котором храним названия шапки модуля,
-    # где хранятся внешние ссылки на разных языках
-    external_links: list[str] = []
-    soup = BeautifulSoup(response.text, 'html.parser')
-    external_tag = soup.find(id=external_links_diff_lang[lang])
-    if external_tag:
-        external_header = external_tag.parent
-        uls_for_links = external_header.find_next_siblings('ul')
-        for ul in uls_for_links:
-            for a_tags in ul.find_all('a', class_='external text'):
-                external_links.append(a_tags.get('href'))
-        with open(links_file, mode='w') as f:
-            print(*external_links, sep='\n', file=f)
-    else:
-        open(links_file, mode='w').close()
+    with open(links_file, mode='w') as f:
+        if wiki_page.external_links:
+            print(*wiki_page.external_links, sep='\n', file=f)
 
 
-def get_category_neighbours(response: requests.Response, lang: str,
-                            nearest_file: str, pause: str) -> None:
+def get_category_neighbours(wiki_page: WikiPage, lang: str,
+                            nearest_file: str, concurrency: int = 1,
+                            fetcher: Fetcher | None = None,
+                            backend: 'str | Backend' = 'html',
+                            top: int | None = None,
+                            resume: bool = False) -> None:
     """
     The function searches for all neighbors by category and writes their name,
     the number of intersected categories and the names of these categories to
     a file
-    :param pause: Pause time between requests
-    :param response: response to a request from the wiki
+    :param wiki_page: the parsed wiki page
     :param lang: National Wiki Section
     :param nearest_file: the name of the file to write
+    :param concurrency: number of simultaneous requests to the wiki
+    :param fetcher: shared HTTP session (a new one if None)
+    :param backend: the way neighbours are found ('html', 'api' or a ready
+    backend object)
+    :param top: write only the top best neighbours (all if None)
+    :param resume: continue the crawl from the last checkpoint
+    :return: None
+    """
+    fetcher = fetcher or Fetcher(pool_size=concurrency)
+    if isinstance(backend, str):
+        backend = make_backend(backend, fetcher, lang)
+    scorer = CategoryScorer(wiki_page.category_names)
+    ranking = NeighbourRanking(scorer, top)
+    checkpoint = CrawlCheckpoint(nearest_file, wiki_page.category_links,
+                                 resume)
+    # Соседи, найденные до прерывания, берутся из потокового файла
+    for title, common in checkpoint.streamed():
+        ranking.add(title, scorer.mask(common))
+    try:
+        asyncio.run(crawl_neighbours(
+            wiki_page.category_names, wiki_page.category_links,
+            backend, concurrency, ranking, checkpoint, fetcher.metrics))
+    finally:
+        checkpoint.close()
+    with open(nearest_file, mode='w') as f:
+        print(*ranking.ranked(), file=f, sep='\n')
+
+
+class CategoryScorer:
+    """
+    Scores neighbours against the base page with bitmasks. Every category of
+    the base page gets its own bit, the categories of a neighbour are turned
+    into the mask of the common ones (one dictionary lookup per category),
+    and the number of common categories is the popcount of the mask. A
+    scored neighbour costs one integer instead of a set of names
+    """
+    def __init__(self, category_names: list[str]):
+        self._names = [*dict.fromkeys(category_names)]
+        self._bits = {name: 1 << bit for bit, name in enumerate(self._names)}
+
+    def mask(self, categories: tp.Iterable[str]) -> int:
+        """
+        The mask of the categories common with the base page
+        :param categories: category names of a neighbour
+        :return: bitmask of the common categories
+        """
+        mask = 0
+        for name in categories:
+            mask |= self._bits.get(name, 0)
+        return mask
+
+    def common(self, mask: int) -> list[str]:
+        """
+        Decodes a mask back into the names of the categories
+        :param mask: bitmask of the common categories
+        :return: names of the common categories in the order of the base page
+        """
+        return [name for bit, name in enumerate(self._names)
+                if mask >> bit & 1]
+
+
+class _RankedNeighbour:
+    """
+    Heap entry of NeighbourRanking: the worse neighbour (fewer common
+    categories, then the later title) is the smaller one
+    """
+    __slots__ = ('title', 'mask', 'count')
+
+    def __init__(self, title: str, mask: int):
+        self.title = title
+        self.mask = mask
+        self.count = mask.bit_count()
+
+    def __lt__(self, other: '_RankedNeighbour') -> bool:
+        return (self.count, other.title) < (other.count, self.title)
+
+
+class NeighbourRanking:
+    """
+    Collects the scored neighbours as bitmasks of CategoryScorer. A neighbour
+    met in several categories is kept once (dictionary by title). With top
+    only the top best neighbours are kept in a heap, so memory does not
+    depend on the size of categories
+    """
+    def __init__(self, scorer: CategoryScorer, top: int | None = None):
+        self.scorer = scorer
+        self._top = top
+        self._neighbours: dict[str, _RankedNeighbour] = {}
+        self._heap: list[_RankedNeighbour] = []
+
+    def add(self, title: str, mask: int) -> None:
+        """
+        Takes into account one neighbour
+        :param title: the title of the neighbour
+        :param mask: bitmask of the categories common with the base page
+        :return: None
+        """
+        if title in self._neighbours:
+            return
+        neighbour = _RankedNeighbour(title, mask)
+        if self._top is None:
+            self._neighbours[title] = neighbour
+        elif len(self._heap) < self._top:
+            self._neighbours[title] = neighbour
+            heapq.heappush(self._heap, neighbour)
+        elif self._heap and self._heap[0] < neighbour:
+            # Вытесненный сосед хуже всех оставшихся, поэтому при повторной
+            # встрече он снова не пройдет этот порог
+            worst = heapq.heapreplace(self._heap, neighbour)
+            del self._neighbours[worst.title]
+            self._neighbours[title] = neighbour
+
+    def ranked(self) -> list[tuple[str, int, list[str]]]:
+        """
+        The neighbours ordered by the number of common categories (descending)
+        and then by title
+        :return: list of (title, number of common categories, common
+        categories)
+        """
+        return [(neighbour.title, neighbour.count,
+                 self.scorer.common(neighbour.mask))
+                for neighbour in sorted(
+                    self._neighbours.values(),
+                    key=lambda item: (-item.count, item.title))]
+
+
+def parse_category_page(html: str, category_name: str, lang: str) \
+        -> tuple[list[tuple[str, str]], str | None]:
+    """
+    Extracts the pages listed on one page of a category
+    :param html: text of the category page
+    :param category_name: the name of the category
+    :param lang: National Wiki Section
+    :return: list of (title, link) of the pages in the category and the link
+    to the next page of the category (None if this page is the last one)
+    """
+    # Список страниц категории и ссылки на соседние страницы списка
+    # находятся в блоке mw-pages, остальную страницу не разбираем
+    category_soup = BeautifulSoup(html, HTML_PARSER,
+                                  parse_only=SoupStrainer('div',
+                                                          id='mw-pages'))
+    category_header_all = category_soup.find_all('h2')
+    for header2 in category_header_all:
+        if category_name in header2.text:
+            header_category = header2
+            break
+    else:
+        # Блока mw-pages нет (в категории только подкатегории или файлы)
+        # либо заголовок не совпал с названием категории
+        return [], None
+    category_dir_tag = header_category.find_next_sibling(
+        'div', class_='mw-content-ltr')
+    if category_dir_tag is not None:
+        category_dir_tag = category_dir_tag.find(
+            'div', class_='mw-category mw-category-columns')
+    if category_dir_tag is None:
+        return [], None
+    neighbours = [(tag_a.text,
+                   f'http://{lang}.wikipedia.org{tag_a.get("href")}')
+                  for tag_a in category_dir_tag.find_all('a')]
+    next_link = None
+    # Смотрим, есть ли ссылка на следующую страницу с категориями
+    for tags_a in category_dir_tag.find_parent().find_next_siblings('a'):
+        if 'pagefrom' in (link := tags_a.get('href')):
+            next_link = f'http://{lang}.wikipedia.org{link}'
+    return neighbours, next_link
+
+
+def get_page_categories(html: str) -> set[str]:
+    """
+    Collects the names of the categories of a wiki page
+    :param html: text of the wiki page
+    :return: set of the category names
+    """
+    return {name for name, _ in extract_categories(html)}
+
+
+class CrawlCheckpoint:
+    """
+    Streams the scored neighbours to the append-only file
+    {nearest_file}.jsonl as they arrive and periodically saves the crawl
+    frontier (unread pages of the category lists and neighbours waiting for
+    scoring) to {nearest_file}.checkpoint.json, so an interrupted crawl is
+    resumed without refetching finished pages. The set of scored neighbours
+    is not saved: it is exactly the titles of the stream and is rebuilt
+    from it on resume
+    """
+    interval = 30.0
+
+    def __init__(self, nearest_file: str, category_links: list[str],
+                 resume: bool = False):
+        self._stream_path = f'{nearest_file}.jsonl'
+        self._path = f'{nearest_file}.checkpoint.json'
+        self._category_links = category_links
+        # Для каждой недочитанной категории - курсор следующей страницы списка
+        # (None - список еще не начат), прочитанные категории удаляются
+        self.frontier: dict[str, str | None] = dict.fromkeys(category_links)
+        # Соседи, уже поставленные в очередь, но еще не оцененные
+        self.pending: dict[str, str] = {}
+        # Уже оцененные соседи (заполняется заново из потокового файла)
+        self.visited: set[str] = set()
+        self._resumed = resume and self._load()
+        self._stream = open(self._stream_path,
+                            mode='a' if self._resumed else 'w',
+                            encoding='utf-8', buffering=1)
+        self._saved_at = time.monotonic()
+
+    def _load(self) -> bool:
+        """
+        Reads the last checkpoint
+        :return: True if the checkpoint exists and belongs to the same page
+        """
+        try:
+            with open(self._path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            print('No checkpoint found, the crawl starts from the beginning')
+            return False
+        if state['categories'] != self._category_links:
+            print('The checkpoint belongs to another page, the crawl starts '
+                  'from the beginning')
+            return False
+        self.frontier = state['frontier']
+        self.pending = state['pending']
+        return True
+
+    def streamed(self) -> tp.Iterator[tuple[str, list[str]]]:
+        """
+        Neighbours scored before the interruption (nothing if the crawl is
+        not resumed). They are marked as visited and removed from the queue:
+        the stream may be ahead of the last checkpoint
+        :return: iterator over (title, common categories)
+        """
+        if not self._resumed:
+            return
+        with open(self._stream_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Последняя строка могла быть дописана не до конца
+                    continue
+                self.visited.add(record['title'])
+                self.pending.pop(record['title'], None)
+                yield record['title'], record['common']
+
+    def is_new(self, title: str) -> bool:
+        """
+        Checks whether the neighbour still has to be scored
+        :param title: the title of the neighbour
+        :return: True if it is neither scored nor waiting in the queue
+        """
+        return title not in self.visited and title not in self.pending
+
+    def add(self, title: str, common: list[str]) -> None:
+        """
+        Writes the scored neighbour to the stream and saves the checkpoint if
+        the previous one is older than interval seconds
+        :param title: the title of the neighbour
+        :param common: common categories of the neighbour and the base page
+        :return: None
+        """
+        print(json.dumps({'title': title, 'common': common},
+                         ensure_ascii=False), file=self._stream)
+        self.visited.add(title)
+        self.pending.pop(title, None)
+        if time.monotonic() - self._saved_at > self.interval:
+            self.save()
+
+    def save(self) -> None:
+        """
+        Atomically replaces the checkpoint file with the current frontier;
+        its size does not depend on the number of scored neighbours
+        :return: None
+        """
+        self._stream.flush()
+        with open(f'{self._path}.tmp', mode='w', encoding='utf-8') as f:
+            json.dump({'categories': self._category_links,
+                       'frontier': self.frontier, 'pending': self.pending},
+                      f, ensure_ascii=False)
+        os.replace(f'{self._path}.tmp', self._path)
+        self._saved_at = time.monotonic()
+
+    def close(self) -> None:
+        """
+        Saves the final state and closes the stream
+        :return: None
+        """
+        self.save()
+        self._stream.close()
+
+
+class HtmlBackend:
+    """
+    Neighbours are found by scraping: the category pages are read one by one
+    following the pagefrom links, every neighbour article is downloaded to
+    read its categories. The pages may be parsed in a pool of processes
+    """
+    batch_size = 1
+
+    def __init__(self, fetcher: Fetcher, lang: str,
+                 parse_pool: Executor | None = None):
+        self._fetcher = fetcher
+        self._lang = lang
+        self._parse_pool = parse_pool
+
+    def _parse(self, function: tp.Callable, *args) -> tp.Any:
+        """
+        Auxiliary function for parsing: in the pool of processes if there is
+        one, otherwise in the calling thread
+        :param function: parsing function
+        :param args: arguments of the function
+        :return: result of the function
+        """
+        with self._fetcher.metrics.timer('parse'):
+            if self._parse_pool is None:
+                return function(*args)
+            return self._parse_pool.submit(function, *args).result()
+
+    def list_category(self, name: str, link: str, cursor: str | None) \
+            -> tuple[list[tuple[str, str]], str | None] | None:
+        """
+        Reads one page of the list of the pages in a category
+        :param name: the name of the category
+        :param link: link to the category
+        :param cursor: link to the page of the list (None for the first one)
+        :return: list of (title, link) of the pages and the cursor of the next
+        page of the list (None if this page is the last one); None if the
+        page could not be received
+        """
+        category_response = self._fetcher.get(cursor or link)
+        # Страницы нет (например, ее нет в кэше в offline-режиме или сервер
+        # отвечает ошибкой и после повторов)
+        if category_response.status_code != requests.codes['ok']:
+            return None
+        return self._parse(parse_category_page, category_response.text,
+                           name, self._lang)
+
+    def get_categories(self, neighbours: list[tuple[str, str]]) \
+            -> list[set[str] | None]:
+        """
+        Collects the categories of the pages
+        :param neighbours: list of (title, link) of the pages
+        :return: set of the category names for every page (None if the page
+        could not be received)
+        """
+        categories: list[set[str] | None] = []
+        for _, link in neighbours:
+            resp_link = self._fetcher.get(link)
+            categories.append(
+                self._parse(get_page_categories, resp_link.text)
+                if resp_link.status_code == requests.codes['ok'] else None)
+        return categories
+
+
+class ApiBackend:
+    """
+    Neighbours are found with the MediaWiki Action API: list=categorymembers
+    returns up to 500 pages of a category per request and prop=categories
+    returns the categories of up to 50 pages per request, so the neighbour
+    articles themselves are never downloaded
+    """
+    batch_size = 50
+
+    def __init__(self, fetcher: Fetcher, lang: str):
+        self._fetcher = fetcher
+        self._lang = lang
+        self._url = f'http://{lang}.wikipedia.org/w/api.php'
+
+    def _query(self, **params) -> dict | None:
+        """
+        Auxiliary function for one request to the API
+        :param params: parameters of action=query
+        :return: the decoded answer (None if the request failed)
+        """
+        response = self._fetcher.get(self._url, params={
+            'action': 'query', 'format': 'json', 'formatversion': 2,
+            **params})
+        if response.status_code != requests.codes['ok']:
+            return None
+        with self._fetcher.metrics.timer('parse'):
+            return response.json()
+
+    @staticmethod
+    def _title(link: str) -> str | None:
+        """
+        Auxiliary function for the full title of a category from its link
+        :param link: link to the category: /wiki/<title> or, for a category
+        without a description page (red link), /w/index.php?title=<title>
+        :return: the title with the namespace (None if the link has neither)
+        """
+        parts = urlsplit(link)
+        if '/wiki/' in parts.path:
+            return unquote(parts.path.split('/wiki/', 1)[1])
+        return parse_qs(parts.query).get('title', [None])[0]
+
+    def list_category(self, name: str, link: str, cursor: str | None) \
+            -> tuple[list[tuple[str, str]], str | None] | None:
+        """
+        Reads one portion of the list of the pages in a category
+        :param name: the name of the category
+        :param link: link to the category
+        :param cursor: cmcontinue of the portion (None for the first one)
+        :return: list of (title, link) of the pages and the cursor of the next
+        portion (None if this portion is the last one); None if the request
+        failed
+        """
+        # Ссылка, из которой не извлечь название, - как категория без списка
+        # страниц в HTML backend
+        if (title := self._title(link)) is None:
+            return [], None
+        params = {'list': 'categorymembers', 'cmtype': 'page',
+                  'cmlimit': 'max', 'cmtitle': title}
+        if cursor:
+            params['cmcontinue'] = cursor
+        if (data := self._query(**params)) is None:
+            return None
+        members = [(member['title'],
+                    f'http://{self._lang}.wikipedia.org/wiki/'
+                    f'{member["title"].replace(" ", "_")}')
+                   for member in data.get('query', {}).get(
+                       'categorymembers', [])]
+        return members, data.get('continue', {}).get('cmcontinue')
+
+    def get_categories(self, neighbours: list[tuple[str, str]]) \
+            -> list[set[str] | None]:
+        """
+        Collects the categories of the pages (without hidden ones, as on the
+        page itself); a redirect gets the categories of its target, as the
+        HTML backend sees them following the link
+        :param neighbours: list of (title, link) of the pages, at most 50
+        :return: set of the category names for every page (None if the page
+        does not exist or the categories could not be received)
+        """
+        titles = [title for title, _ in neighbours]
+        params = {'prop': 'categories', 'clshow': '!hidden',
+                  'cllimit': 'max', 'redirects': 1,
+                  'titles': '|'.join(titles)}
+        categories: dict[str, set[str]] = {}
+        renamed: dict[str, str] = {}
+        redirected: dict[str, str] = {}
+        # Категорий всех страниц может не хватить на один ответ
+        while True:
+            # Без одной из порций категории страниц неполны, не верим ни одной
+            if (data := self._query(**params)) is None:
+                return [None] * len(titles)
+            query = data.get('query', {})
+            renamed.update((normalized['from'], normalized['to'])
+                           for normalized in query.get('normalized', []))
+            redirected.update((redirect['from'], redirect['to'])
+                              for redirect in query.get('redirects', []))
+            for page in query.get('pages', []):
+                if page.get('missing') or page.get('invalid'):
+                    continue
+                # Название категории без пространства имен ("Категория:")
+                categories.setdefault(page['title'], set()).update(
+                    category['title'].split(':', 1)[1]
+                    for category in page.get('categories', []))
+            if 'continue' not in data:
+                break
+            params.update(data['continue'])
+        # Запрошенное название сначала нормализуется, затем по нему
+        # проходит перенаправление
+        return [categories.get(redirected.get(title, title)) for title in (
+            renamed.get(title, title) for title in titles)]
+
+
+class IndexedBackend:
+    """
+    Backend answering from the local CategoryIndex: only the category lists
+    and the pages whose entries are missing or stale are requested from the
+    wiki, and the answers refresh the index
+    """
+    def __init__(self, backend: HtmlBackend | ApiBackend,
+                 index: CategoryIndex, lang: str):
+        self._backend = backend
+        self._index = index
+        self._lang = lang
+        self.batch_size = backend.batch_size
+
+    def list_category(self, name: str, link: str, cursor: str | None) \
+            -> tuple[list[tuple[str, str]], str | None] | None:
+        """
+        Reads one portion of the list of the pages in a category; a fresh
+        list is returned from the index as a whole. A failed portion is not
+        written, so the list is never marked fresh before all its portions are
+        received
+        :param name: the name of the category
+        :param link: link to the category
+        :param cursor: cursor of the portion (None for the first one)
+        :return: list of (title, link) of the pages and the cursor of the next
+        portion (None if this portion is the last one); None if the portion
+        could not be received
+        """
+        if cursor is None and (members := self._index.get_members(
+                self._lang, link)) is not None:
+            return members, None
+        if (portion := self._backend.list_category(
+                name, link, cursor)) is None:
+            return None
+        members, next_cursor = portion
+        self._index.put_members(self._lang, link, members, cursor is None,
+                                next_cursor is None)
+        return members, next_cursor
+
+    def get_categories(self, neighbours: list[tuple[str, str]]) \
+            -> list[set[str] | None]:
+        """
+        Collects the categories of the pages, only pages without a fresh
+        entry in the index are requested
+        :param neighbours: list of (title, link) of the pages
+        :return: set of the category names for every page (None if the page
+        could not be received)
+        """
+        categories: dict[str, set[str] | None] = self._index.get_categories(
+            self._lang, [title for title, _ in neighbours])
+        stale = [neighbour for neighbour in neighbours
+                 if neighbour[0] not in categories]
+        if stale:
+            refreshed = dict(zip((title for title, _ in stale),
+                                 self._backend.get_categories(stale)))
+            self._index.put_categories(
+                self._lang, {title: names for title, names in refreshed.items()
+                             if names is not None})
+            categories.update(refreshed)
+        return [categories[title] for title, _ in neighbours]
+
+
+class SharedBackend:
+    """
+    Memoizing wrapper over a backend shared by all articles of a batch: the
+    lists of a category and the categories of a page are requested once per
+    batch, however many articles have them in common
+    """
+    def __init__(self, backend: HtmlBackend | ApiBackend | IndexedBackend):
+        self._backend = backend
+        self.batch_size = backend.batch_size
+        self._lists: dict[tuple[str, str | None],
+                          tuple[list[tuple[str, str]], str | None]] = {}
+        self._categories: dict[str, set[str]] = {}
+
+    def list_category(self, name: str, link: str, cursor: str | None) \
+            -> tuple[list[tuple[str, str]], str | None] | None:
+        """
+        Reads one portion of the list of the pages in a category; failures
+        are not memoized, the next article asks again
+        :param name: the name of the category
+        :param link: link to the category
+        :param cursor: cursor of the portion (None for the first one)
+        :return: list of (title, link) of the pages and the cursor of the next
+        portion (None if this portion is the last one); None if the portion
+        could not be received
+        """
+        if (link, cursor) not in self._lists:
+            if (portion := self._backend.list_category(
+                    name, link, cursor)) is None:
+                return None
+            self._lists[link, cursor] = portion
+        return self._lists[link, cursor]
+
+    def get_categories(self, neighbours: list[tuple[str, str]]) \
+            -> list[set[str] | None]:
+        """
+        Collects the categories of the pages, only unknown ones are requested
+        :param neighbours: list of (title, link) of the pages
+        :return: set of the category names for every page (None if the page
+        could not be received)
+        """
+        unknown = [neighbour for neighbour in neighbours
+                   if neighbour[0] not in self._categories]
+        if unknown:
+            for (title, _), categories in zip(
+                    unknown, self._backend.get_categories(unknown)):
+                if categories is not None:
+                    self._categories[title] = categories
+        return [self._categories.get(title) for title, _ in neighbours]
+
+
+BACKENDS = {'html': HtmlBackend, 'api': ApiBackend}
+Backend = HtmlBackend | ApiBackend | SharedBackend | IndexedBackend
+
+
+def make_backend(name: str, fetcher: Fetcher, lang: str,
+                 index: CategoryIndex | None = None,
+                 parse_pool: Executor | None = None) \
+        -> HtmlBackend | ApiBackend | IndexedBackend:
+    """
+    Creates the backend of the crawl
+    :param name: the way neighbours are found ('html' or 'api')
+    :param fetcher: shared HTTP session
+    :param lang: National Wiki Section
+    :param index: local index of categories (not used if None)
+    :param parse_pool: pool of processes for parsing HTML pages
+    :return: the backend
+    """
+    backend = (HtmlBackend(fetcher, lang, parse_pool) if name == 'html'
+               else BACKENDS[name](fetcher, lang))
+    return backend if index is None else IndexedBackend(backend, index, lang)
+
+
+async def crawl_neighbours(category_names: list[str],
+                           category_links: list[str],
+                           backend: Backend,
+                           concurrency: int,
+                           ranking: NeighbourRanking,
+                           checkpoint: CrawlCheckpoint,
+                           metrics: Metrics | None = None) -> None:
+    """
+    Walks through all pages of all categories and all pages listed in them.
+    Category lists are read by one producer per category, the categories of
+    the neighbours are requested by a pool of concurrency workers in batches
+    of backend.batch_size pages; the rate of requests is limited by the
+    fetcher of the backend. Only the
+    part of the crawl left in the checkpoint is done, every neighbour is
+    scored once
+    :param category_names: names of the categories of the base page
+    :param category_links: links to the categories of the base page
+    :param backend: the way the wiki is queried
+    :param concurrency: number of simultaneous requests to the wiki
+    :param ranking: collector of the scored neighbours
+    :param checkpoint: stream of the results and state of the crawl
+    :param metrics: metrics for the numbers of pages in the categories
     :return: None
     """
-    soup = BeautifulSoup(response.text, 'html.parser')
-    list_category_names: [str] = []
-    list_category_links: [str] = []
-    list_for_write_in_file: [tuple[str, int, [...]]] = []
-    category_tags_a = soup.find('div', class_='mw-normal-catlinks').find(
-        'ul').find_all('a')
-    # Собираем все ссылки из раздела с категориями
-    for tag_a in category_tags_a:
-        list_category_names.append(tag_a.text)
-        list_category_links.append(
-            f'http://{lang}.wikipedia.org{tag_a.get("href")}')
-    for num_category_link, category_link in enumerate(
-            tqdm(list_category_links, position=0, colour='red')):
-        category_response = requests.get(
-            category_link)  # Ходим по всем категориям страницы
-        flag_for_next_page = True
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    queue: asyncio.Queue[list[tuple[str, str]] | None] = asyncio.Queue(
+        maxsize=4 * concurrency)
+    scorer = ranking.scorer
+    progress = tqdm(total=0, position=0, colour='red')
+
+    async def call(function: tp.Callable, *args) -> tp.Any:
+        async with semaphore:
+            return await loop.run_in_executor(executor, function, *args)
+
+    async def put_neighbours(neighbours: list[tuple[str, str]]) -> None:
+        progress.total += len(neighbours)
+        progress.refresh()
+        for i in range(0, len(neighbours), backend.batch_size):
+            await queue.put(neighbours[i:i + backend.batch_size])
+
+    async def read_category(name: str, link: str) -> None:
+        cursor = checkpoint.frontier[link]
+        items = 0
         # Если в категории много страниц, ходим по каждой из них
-        # (обновление флага внизу)
-        while flag_for_next_page:
-            category_soup = BeautifulSoup(category_response.text,
-                                          'html.parser')
-            category_header_all = category_soup.find_all('h2')
-            for header2 in category_header_all:
-                if list_category_names[num_category_link] in header2.text:
-                    header_category = header2
-                    break
-            category_dir_tag = (header_category.find_next_sibling(
-                'div', class_='mw-content-ltr').
-                                find('div', class_='mw-category '
-                                                   'mw-category-columns'))
-            for tag_a in tqdm(category_dir_tag.find_all('a'), leave=False,
-                              position=1, colour='red'):
-                sleep(pause)  # Ходим по всем ссылкам в определенной категории
-                link_in_category = (f'http://{lang}.wikipedia.org'
-                                    f'{tag_a.get("href")}')
-                resp_link = requests.get(link_in_category)
-                soup_for_neighbour = BeautifulSoup(resp_link.text,
-                                                   'html.parser')
-                neighbour_category_names: set[str] = set()
-                neighbour_a_tags_in_category = (
-                    soup_for_neighbour.find('div',
-                                            class_='mw-normal-catlinks').find(
-                        'ul').find_all('a'))
-                for a_tag in neighbour_a_tags_in_category:
-                    neighbour_category_names.add(a_tag.text)
-                intersec_neighbours_and_base = set(
-                    list_category_names).intersection(neighbour_category_names)
-                list_for_write_in_file.append(
-                    (tag_a.text, len(intersec_neighbours_and_base),
-                     [*intersec_neighbours_and_base]))
-            next_page_tags_a = (category_dir_tag.
-                                find_parent().find_next_siblings('a'))
-            # Смотрим, есть ли ссылка на следующую страницу с категориями
-            if next_page_tags_a:
-                for tags_a in next_page_tags_a:
-                    link = tags_a.get('href')
-                    if 'pagefrom' in link:
-                        flag_for_next_page = True
-                        category_response = requests.get(
-                            f'http://{lang}.wikipedia.org{link}')
-                    else:
-                        flag_for_next_page = False
+        while True:
+            portion = await call(backend.list_category, name, link, cursor)
+            if portion is None:
+                # Категория остается в frontier с курсором недочитанной
+                # страницы: при возобновлении она будет прочитана заново
+                print(f'Could not read the category {name}, its list is '
+                      f'incomplete')
+                return
+            neighbours, cursor = portion
+            items += len(neighbours)
+            # Соседа из нескольких категорий оцениваем один раз
+            neighbours = [(title, neighbour_link)
+                          for title, neighbour_link in neighbours
+                          if checkpoint.is_new(title)]
+            checkpoint.pending.update(neighbours)
+            if cursor is None:
+                del checkpoint.frontier[link]
             else:
-                flag_for_next_page = False
-    unique_value: list[tuple[str, int, ...]] = []
-    for x in list_for_write_in_file:  # Убираем повторы
-        if x not in unique_value:
-            unique_value.append(x)
-    unique_value.sort(key=lambda key: key[0])
-    unique_value.sort(key=lambda key: key[1], reverse=True)
-    with open(nearest_file, mode='w') as f:
-        print(*unique_value, file=f, sep='\n')
+                checkpoint.frontier[link] = cursor
+            await put_neighbours(neighbours)
+            if cursor is None:
+                break
+        if metrics is not None:
+            metrics.add_category(name, items)
+
+    async def read_all_categories() -> None:
+        # Сначала соседи, не оцененные до прерывания
+        await put_neighbours([*checkpoint.pending.items()])
+        await asyncio.gather(*(read_category(name, link) for name, link
+                               in zip(category_names, category_links)
+                               if link in checkpoint.frontier))
+        # Сообщаем каждому воркеру, что страниц больше не будет
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker() -> None:
+        while (batch := await queue.get()) is not None:
+            batch_categories = await call(backend.get_categories, batch)
+            progress.update(len(batch))
+            for (title, _), categories in zip(batch, batch_categories):
+                # Страницу не удалось получить
+                if categories is None:
+                    continue
+                mask = scorer.mask(categories)
+                checkpoint.add(title, scorer.common(mask))
+                ranking.add(title, mask)
+
+    try:
+        await asyncio.gather(read_all_categories(),
+                             *(worker() for _ in range(concurrency)))
+    finally:
+        progress.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def read_batch(batch_file: str, lang: str) -> list[tuple[str, str]]:
+    """
+    Reads the list of articles of a batch: one article per line, the title
+    and optionally the national wiki section separated by a tab; empty lines
+    and lines starting with # are skipped
+    :param batch_file: the name of the file with the articles
+    :param lang: National Wiki Section for lines without it
+    :return: list of (page, lang)
+    """
+    articles: list[tuple[str, str]] = []
+    with open(batch_file, encoding='utf-8') as f:
+        for line in f:
+            if not (line := line.strip()) or line.startswith('#'):
+                continue
+            page, _, page_lang = line.partition('\t')
+            articles.append((page.strip(), page_lang.strip() or lang))
+    return articles
+
+
+def run_batch(articles: list[tuple[str, str]], batch_dir: str,
+              concurrency: int, fetcher: Fetcher, backend: str = 'html',
+              top: int | None = None, resume: bool = False,
+              processes: int | None = None,
+              index: CategoryIndex | None = None) -> None:
+    """
+    Processes many articles in one run: all of them share the fetcher (and
+    its cache) and one memoizing backend per national wiki section, so the
+    categories common to several articles are requested once; HTML pages are
+    parsed in a pool of processes. The files of the article page in lang are
+    {batch_dir}/{lang}_{page}_links.txt and {lang}_{page}_nearest.txt. An
+    article that fails (raises or cannot be received: not found, an error
+    answer after the retries, missing in the offline cache, no connection)
+    does not stop the batch: its checkpoint is kept and it is listed in
+    {batch_dir}/failed.tsv (a batch file for a rerun)
+    :param articles: list of (page, lang)
+    :param batch_dir: the directory for the files of the articles
+    :param concurrency: number of simultaneous requests to the wiki
+    :param fetcher: shared HTTP session
+    :param backend: the way neighbours are found ('html' or 'api')
+    :param top: write only the top best neighbours (all if None)
+    :param resume: continue the crawls from the last checkpoints
+    :param processes: number of processes for parsing (cpu count if None)
+    :param index: local index of categories (not used if None)
+    :return: None
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    shared_backends: dict[str, SharedBackend] = {}
+    failed: list[tuple[str, str]] = []
+    with ProcessPoolExecutor(max_workers=processes) as parse_pool:
+        for page, lang in tqdm(articles, colour='green'):
+            if lang not in shared_backends:
+                shared_backends[lang] = SharedBackend(make_backend(
+                    backend, fetcher, lang, index, parse_pool))
+            # Название статьи может содержать символы, запрещенные в именах
+            # файлов
+            file_page = re.sub(r'[\\/:*?<>|"]', '_', page)
+            prefix = os.path.join(batch_dir, f'{lang}_{file_page}')
+            try:
+                # Причину неудачи go_to_wiki уже напечатала
+                if not go_to_wiki(page, lang, f'{prefix}_links.txt',
+                                  f'{prefix}_nearest.txt', concurrency,
+                                  fetcher, shared_backends[lang], top,
+                                  resume):
+                    failed.append((page, lang))
+            except Exception as error:
+                # Одна неудачная статья не должна останавливать весь пакет,
+                # ее контрольная точка сохраняется для --resume
+                print(f'Failed {lang}:{page}: {type(error).__name__}: '
+                      f'{error}')
+                failed.append((page, lang))
+    failed_file = os.path.join(batch_dir, 'failed.tsv')
+    if failed:
+        with open(failed_file, mode='w', encoding='utf-8') as f:
+            print(*(f'{page}\t{lang}' for page, lang in failed), sep='\n',
+                  file=f)
+        print(f'{len(failed)} of {len(articles)} articles failed, see '
+              f'{failed_file}')
+    elif os.path.exists(failed_file):
+        # Список от прошлого запуска устарел
+        os.remove(failed_file)
 
 
 def main() -> None:
@@ -285,7 +2003,7 @@ def main() -> None:
         description='A program that makes automatic queries in Wikipedia and '
                     'records external links and relationships with neighbors '
                     'by category in files upon successful connection')
-    parser.add_argument('page', type=str,
+    parser.add_argument('page', type=str, nargs='?',
                         help='The query of interest in the wiki')
     parser.add_argument('--pause', type=compute_pause,
                         default='3s',
@@ -301,7 +2019,17 @@ def main() -> None:
                              'this: gauss:1000/2.0 or gauss:200ms/3.0, '
                              'where between the colon and the slash is the '
                              'center of the normal distribution, after the'
-                             ' slash is the standard deviation.')
+                             ' slash is the standard deviation. A new pause '
+                             'is drawn for every request to a host; with '
+                             '--rate the pauses are scaled to that rate.')
+    parser.add_argument('--rate', type=to_positive_float, default=None,
+                        help='Target number of requests per second to one '
+                             'host. The rate is halved after 429/503 answers '
+                             'and restored on healthy ones. Default = 1 / '
+                             'mean pause')
+    parser.add_argument('--burst', type=to_positive_int, default=1,
+                        help='Number of requests to one host that may be '
+                             'sent at once after a quiet period. Default = 1')
     parser.add_argument('--lang', type=str, default='en',
                         help='National wikipedia section (fr, de, etc.).'
                              ' Default = en')
@@ -315,14 +2043,134 @@ def main() -> None:
                         help='The file in which relationships with neighbors '
                              'by category will be recorded.'
                              ' Default = nearest.txt')
+    parser.add_argument('--concurrency', type=to_positive_int,
+                        default=1,
+                        help='Number of simultaneous requests to the wiki '
+                             'while crawling category neighbours and checking '
+                             'links. The rate of requests is still limited '
+                             'by --pause/--rate. Default = 1')
+    parser.add_argument('--backend', choices=[*BACKENDS], default='html',
+                        help='The way neighbours by category are found: '
+                             'html - scraping of the category and neighbour '
+                             'pages, api - MediaWiki Action API (far fewer '
+                             'requests). Default = html')
+    parser.add_argument('--top', type=to_positive_int, default=None,
+                        help='Write only the given number of neighbours with '
+                             'the most common categories. By default all '
+                             'neighbours are written')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted crawl from the last '
+                             'checkpoint ({nearest_file}.checkpoint.json) '
+                             'without refetching finished pages')
+    parser.add_argument('--batch', type=str, default=None,
+                        help='File with many articles to process in one run: '
+                             'one title per line, optionally followed by a '
+                             'tab and the national wiki section. The '
+                             'categories shared by the articles are requested '
+                             'once')
+    parser.add_argument('--batch_dir', type=str, default='batch',
+                        help='Directory for the files of the articles of a '
+                             'batch. Default = batch')
+    parser.add_argument('--processes', type=to_positive_int, default=None,
+                        help='Number of processes parsing HTML pages in a '
+                             'batch. Default = number of CPUs')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='Timeout of one request in seconds. '
+                             'Default = 10')
+    parser.add_argument('--retries', type=to_non_negative_int, default=3,
+                        help='Number of retries of a request after a timeout, '
+                             'a broken connection or a 429/5xx answer. '
+                             'Default = 3')
+    parser.add_argument('--proxy', type=str, default=None,
+                        help='HTTP proxy for all requests, e.g. the local '
+                             'stand-in server replay_server.py')
+    parser.add_argument('--record', type=str, default=None,
+                        help='JSONL file to which all responses received '
+                             'from the network are recorded as fixtures for '
+                             'replay_server.py')
+    parser.add_argument('--metrics_out', type=str, default=None,
+                        help='The file for the report of the run: request '
+                             'latency, parse time, bytes, cache hit rate, '
+                             'retries, throttling and pages per category')
+    parser.add_argument('--metrics_format', choices=['json', 'prometheus'],
+                        default='json',
+                        help='Format of the report: json or prometheus '
+                             '(text exposition format). Default = json')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Profile the requests and the parsing with '
+                             'cProfile and write the statistics to the file '
+                             '(python -m pstats FILE)')
+    parser.add_argument('--cache_dir', type=str, default='.wiki_cache',
+                        help='Directory of the persistent page cache. '
+                             'Default = .wiki_cache')
+    parser.add_argument('--cache_size', type=float, default=500,
+                        help='Maximal size of the page cache in megabytes, '
+                             'the least recently used pages are evicted. '
+                             'Default = 500')
+    parser.add_argument('--cache_ttl', type=float, default=24,
+                        help='Time in hours during which a cached page is '
+                             'used without asking the wiki; older pages are '
+                             'revalidated. Default = 24')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Do not use the page cache')
+    parser.add_argument('--index_ttl', type=float, default=168,
+                        help='Time in hours during which the categories of a '
+                             'page and the pages of a category are taken from '
+                             'the local index ({cache_dir}/index.sqlite) '
+                             'without asking the wiki. Default = 168')
+    parser.add_argument('--no_index', action='store_true',
+                        help='Do not use the local index of categories')
+    parser.add_argument('--offline', action='store_true',
+                        help='Use only the page cache and never the network')
     args = parser.parse_args()
+    if (args.page is None) == (args.batch is None):
+        parser.error('either the page or --batch should be given')
     page = args.page
-    print(args.page)
     pause = args.pause
     lang = args.lang
     links_file = args.links_file
     nearest_file = args.nearest_file
-    go_to_wiki(page, lang, links_file, nearest_file, pause)
+    concurrency = args.concurrency
+    if args.no_cache and args.offline:
+        parser.error('--offline requires the page cache')
+    cache = None if args.no_cache else PageCache(
+        args.cache_dir, max_size=int(args.cache_size * 2 ** 20),
+        ttl=args.cache_ttl * 3600)
+    metrics = Metrics()
+    profile_hook = ProfileHook(args.profile) if args.profile else None
+    if profile_hook is not None:
+        metrics.hooks.append(profile_hook)
+    fetcher = Fetcher(timeout=args.timeout, retries=args.retries,
+                      pool_size=concurrency, cache=cache,
+                      offline=args.offline, rate=args.rate,
+                      burst=args.burst, pause=pause,
+                      recorder=FixtureRecorder(args.record)
+                      if args.record else None, proxy=args.proxy,
+                      metrics=metrics)
+    # В offline-режиме обновить индекс все равно нельзя
+    index = None if args.no_index else CategoryIndex(
+        os.path.join(args.cache_dir, 'index.sqlite'),
+        ttl=float('inf') if args.offline else args.index_ttl * 3600)
+    try:
+        if args.batch:
+            run_batch(read_batch(args.batch, lang), args.batch_dir,
+                      concurrency, fetcher, args.backend, args.top,
+                      args.resume, args.processes, index)
+        else:
+            print(page)
+            go_to_wiki(page, lang, links_file, nearest_file,
+                       concurrency, fetcher,
+                       make_backend(args.backend, fetcher, lang, index),
+                       args.top, args.resume)
+    finally:
+        fetcher.close()
+        if index is not None:
+            index.close()
+        # Отчет пишется и после прерванного запуска
+        if args.metrics_out:
+            metrics.save(args.metrics_out, args.metrics_format)
+        if profile_hook is not None:
+            profile_hook.save()
 
 
 if __name__ == '__main__':
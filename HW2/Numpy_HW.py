@@ -1,5 +1,14 @@
+import heapq
 import numpy as np
 import typing as tp
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from scipy import sparse
+    from scipy.sparse import linalg as sparse_linalg
+except ImportError:
+    sparse = None
+    sparse_linalg = None
 
 ###################
 # Task 1-2       ##
@@ -19,6 +28,13 @@ class Solution:
         self._free_variables = free_variables
         self._B = B
         self._FSR = FSR
+        # Номера зависимых и свободных переменных считаем один раз
+        if free_variables is not None:
+            self._dependent = np.flatnonzero(free_variables == 0)
+            self._free = np.flatnonzero(free_variables == 1)
+        # Транспонированная ФСР для умножения сразу всех векторов
+        # коэффициентов (считается при первом вызове)
+        self._FSR_T: np.ndarray | None = None
 
     def is_single(self) -> bool:
         """
@@ -42,77 +58,583 @@ class Solution:
         :return: callable объект любого класса, принимающий вектор длиной,
         равной числу степеней свободы решения и возвращающий решение,
         полученное применением переданных значений в качестве коэффициентов
-        в формуле решения уравнения
+        в формуле решения уравнения. Можно передать сразу матрицу (k,
+        freedom_degrees) коэффициентов, тогда возвращается матрица из k
+        решений, а в out - готовый массив для результата. В work можно
+        передать рабочий массив (k, m - freedom_degrees) для произведения
+        коэффициентов на ФСР, тогда вызов не выделяет память
         """
         if not np.any(self._free_variables):
-            return lambda coeffs: self._B
+            return self.__single_solution
         else:
             return self.__many_solutions
 
-    def __many_solutions(self, coeffs: np.ndarray) -> np.ndarray:
+    def __single_solution(self, coeffs: np.ndarray | None = None,
+                          out: np.ndarray | None = None,
+                          work: np.ndarray | None = None) -> np.ndarray:
+        """
+        Вспомогательная функция для единственного решения
+        :param coeffs: Не используется (кроме числа строк k, если передана
+        матрица)
+        :param out: Массив для результата
+        :param work: Не используется
+        :return: Решение (или k его копий)
+        """
+        shape = self._B.shape
+        if coeffs is not None and np.ndim(coeffs) == 2:
+            shape = (np.shape(coeffs)[0], *shape)
+        if out is None:
+            return np.broadcast_to(self._B, shape).copy()
+        out[...] = self._B
+        return out
+
+    def __many_solutions(self, coeffs: np.ndarray,
+                         out: np.ndarray | None = None,
+                         work: np.ndarray | None = None) -> np.ndarray:
         """
         Вспомогательная функция для реализации конкретного решения из ФСР
-        :param coeffs: Коэффициенты свободных неизвестных (коэффициенты ФСР)
-        :return: Вектор из ФСР, записанный в виде вектора np.ndarray
+        :param coeffs: Коэффициенты свободных неизвестных (коэффициенты ФСР):
+        вектор (freedom_degrees,) или матрица (k, freedom_degrees)
+        :param out: Массив (m,) или (k, m) для результата
+        :param work: Рабочий массив (m - freedom_degrees,) или (k, m -
+        freedom_degrees) того же типа, что и результат, для значений
+        зависимых переменных (по умолчанию выделяется при каждом вызове)
+        :return: Вектор из ФСР, записанный в виде вектора np.ndarray (или
+        матрица из k таких векторов)
         """
-        solutions = np.zeros(self._free_variables.shape[0])
-        diff_solution = self._B - self._FSR @ coeffs
-        solutions[np.where(self._free_variables == 0)[0]] = (diff_solution
-                                                             .flatten())
-        solutions[np.where(self._free_variables == 1)[0]] = coeffs
-        return solutions
+        coeffs = np.asarray(coeffs)
+        batch = coeffs.reshape(-1, self._free.shape[0])
+        if out is None:
+            out = np.empty((*coeffs.shape[:-1],
+                            self._free_variables.shape[0]),
+                           dtype=np.result_type(self._B, batch))
+        solutions = out if out.ndim == 2 else out[np.newaxis]
+        if not isinstance(self._FSR, np.ndarray):
+            # Разреженная ФСР
+            diff_solution = self._B - (self._FSR @ batch.T).T
+        else:
+            if self._FSR_T is None:
+                self._FSR_T = np.ascontiguousarray(self._FSR.T)
+            if work is not None and work.ndim == 1:
+                work = work[np.newaxis]
+            # Произведение пишется в рабочий массив (или во временный, если
+            # он не передан), вычитание делается в нем же
+            diff_solution = np.matmul(batch, self._FSR_T, out=work)
+            np.subtract(self._B, diff_solution, out=diff_solution)
+        solutions[:, self._dependent] = diff_solution
+        solutions[:, self._free] = batch
+        return out
+
+
+# Порог нуля относителен к масштабу данных: элемент считается нулем, если
+# он меньше ZERO_FACTOR * max(n, m) * eps * ||A||_F (eps - машинная точность
+# типа вычислений). Запас ZERO_FACTOR покрывает рост ошибок округления при
+# исключении, ведущие элементы невырожденных систем больше порога на много
+# порядков
+ZERO_FACTOR = 100
+
+
+def _zero_thresholds(shape: tuple[int, int], dtype: tp.Any,
+                     norm_A: tp.Any, norm_B: tp.Any) -> tuple[tp.Any, tp.Any]:
+    """
+    Вспомогательная функция для порогов нуля, относительных к масштабу
+    системы
+    :param shape: Размер матрицы системы (n, m)
+    :param dtype: Тип вычислений
+    :param norm_A: Норма Фробениуса матрицы системы (или массив норм для
+    стопки систем)
+    :param norm_B: Норма правой части (или массив норм)
+    :return: порог для ведущих элементов и порог для правой части строк без
+    ведущего элемента
+    """
+    scale = ZERO_FACTOR * max(shape) * np.finfo(dtype).eps
+    return scale * norm_A, scale * norm_B
+
+
+def gauss_solver(A_B: np.ndarray) -> None | Solution | list[None | Solution]:
+    """
+    Функция решает систему линейных уравнений. Можно передать сразу стопку
+    систем одного размера формы (k, n, m + 1), тогда они решаются все вместе.
+    Разреженная матрица scipy.sparse решается функцией sparse_gauss_solver
+    :param A_B: Матрица СЛАУ (или стопка матриц)
+    :return: возвращает None в случае отсутствия решения и объект класса
+    Solution в случае, если решение есть. Для стопки матриц - список из k
+    таких значений
+    """
+    if sparse is not None and sparse.issparse(A_B):
+        return sparse_gauss_solver(A_B)
+    if not np.issubdtype(A_B.dtype, np.floating):
+        A_B = A_B.astype(np.float64)
+    batch = A_B if A_B.ndim == 3 else A_B[np.newaxis]
+    # Пороги считаются по исходным матрицам, до исключения на месте
+    pivot_tolerance, rhs_tolerance = _zero_thresholds(
+        batch.shape[1:], batch.dtype,
+        np.linalg.norm(batch[:, :, :-1], axis=(1, 2)),
+        np.linalg.norm(batch[:, :, -1], axis=1))
+    ranks, free_variables = _eliminate(batch, pivot_tolerance)
+    solutions = [_make_solution(reduced, free, rank, tolerance)
+                 for reduced, free, rank, tolerance
+                 in zip(batch, free_variables, ranks, rhs_tolerance)]
+    return solutions if A_B.ndim == 3 else solutions[0]
+
+
+def _eliminate(A_B: np.ndarray, tolerance: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """
+    Прямой и обратный ход Гаусса на месте для стопки матриц (k, n, m + 1).
+    Все системы обрабатывают очередной столбец одновременно, а исключение по
+    ведущему элементу делается одним обновлением ранга 1 для всех строк
+    :param A_B: Стопка матриц СЛАУ, приводится к упрощенному ступенчатому виду
+    :param tolerance: Порог нуля для ведущих элементов каждой системы (k,)
+    :return: ранги систем (k,) и маски свободных переменных (k, m)
+    """
+    k, n, m = A_B.shape[0], A_B.shape[1], A_B.shape[2] - 1
+    systems = np.arange(k)
+    rows = np.arange(n)
+    ranks = np.zeros(k, dtype=np.intp)
+    free_variables = np.ones((k, m), dtype=bool)
+    for col in range(m):
+        # Системы, в которых еще остались строки без ведущего элемента
+        active = systems[ranks < n]
+        if active.size == 0:
+            break
+        row = ranks[active]
+        # Индекс максимального элемента столбца среди оставшихся строк
+        column = np.abs(A_B[active, :, col])
+        column[rows < row[:, np.newaxis]] = -1
+        index_max_elem = np.argmax(column, axis=1)
+        max_value = A_B[active, index_max_elem, col]
+        # В системах, где в столбце только нули, переменная свободная
+        pivot = np.abs(max_value) > tolerance[active]
+        active, row = active[pivot], row[pivot]
+        index_max_elem, max_value = index_max_elem[pivot], max_value[pivot]
+        if active.size == 0:
+            continue
+        # Переставляем строчку с максимальным элементом и нынешнюю строчку
+        pivot_rows = A_B[active, index_max_elem] / max_value[:, np.newaxis]
+        A_B[active, index_max_elem] = A_B[active, row]
+        A_B[active, row] = pivot_rows
+        # Если ведущий элемент нашелся во всех системах, обходимся срезом
+        # вместо копирования по индексам
+        index = slice(None) if active.size == k else active
+        factors = A_B[index, :, col].copy()
+        factors[np.arange(active.size), row] = 0
+        A_B[index, :, col:] -= (factors[:, :, np.newaxis]
+                                * pivot_rows[:, np.newaxis, col:])
+        # Переменная с номером col не свободная (зависимая)
+        free_variables[active, col] = False
+        ranks[active] += 1
+    return ranks, free_variables
+
+
+def _make_solution(A_B: np.ndarray, free_variables: np.ndarray,
+                   rank: int, tolerance: float) -> None | Solution:
+    """
+    Вспомогательная функция, собирающая решение из приведенной матрицы
+    :param A_B: Матрица СЛАУ в упрощенном ступенчатом виде
+    :param free_variables: Маска свободных переменных
+    :param rank: Ранг матрицы системы
+    :param tolerance: Порог нуля для правой части
+    :return: None в случае отсутствия решения, иначе объект Solution
+    """
+    # Нет решений: в нулевой строке ненулевая правая часть
+    if np.any(np.abs(A_B[rank:, -1]) > tolerance):
+        return None
+    freedom_degrees = int(np.sum(free_variables))
+    # Решение одно
+    if freedom_degrees == 0:
+        return Solution(single_flag=True, freedom_degrees=0,
+                        free_variables=None, B=A_B[:rank, -1], FSR=None)
+    # Бесконечно решений
+    return Solution(single_flag=False, freedom_degrees=freedom_degrees,
+                    free_variables=free_variables.astype(np.int8),
+                    B=A_B[:rank, -1], FSR=A_B[:rank, :-1][:, free_variables])
+
+
+def sparse_gauss_solver(A_B: tp.Any, threshold: float = 0.1) \
+        -> None | Solution:
+    """
+    Функция решает разреженную систему линейных уравнений, заданную матрицей
+    scipy.sparse (CSR, COO и т.д.). Хранятся только ненулевые элементы строк.
+    Очередным исключается столбец с наименьшим числом ненулевых элементов в
+    оставшихся строках, что уменьшает заполнение. Ведущая строка выбирается
+    пороговым выбором: среди строк, где элемент не меньше threshold от
+    максимального по модулю в столбце, берется самая короткая. ФСР
+    возвращается в виде разреженной матрицы scipy.sparse. Невырожденная
+    квадратная система решается разложением SuperLU из scipy, исключение
+    на словарях строк (чистый Python, порядка десятков тысяч ненулевых
+    элементов в секунду) нужно только для вырожденных и прямоугольных
+    систем
+    :param A_B: Разреженная матрица СЛАУ (n, m + 1)
+    :param threshold: Порог выбора ведущего элемента (от 0 до 1, 1 - выбор
+    максимального элемента)
+    :return: возвращает None в случае отсутствия решения и объект класса
+    Solution в случае, если решение есть.
+    """
+    if sparse is None:
+        raise ImportError('scipy is required for sparse matrices')
+    A_B = sparse.csc_matrix(A_B, dtype=np.float64)
+    n, m = A_B.shape[0], A_B.shape[1] - 1
+    tolerance, rhs_tolerance = _zero_thresholds(
+        (n, m), np.float64, sparse_linalg.norm(A_B[:, :-1]),
+        sparse_linalg.norm(A_B[:, -1]))
+    if n == m and n:
+        try:
+            lu = sparse_linalg.splu(A_B[:, :-1])
+        except RuntimeError:
+            # Матрица точно вырожденная
+            lu = None
+        if lu is not None and \
+                np.min(np.abs(lu.U.diagonal())) > tolerance:
+            return Solution(single_flag=True, freedom_degrees=0,
+                            free_variables=None,
+                            B=lu.solve(A_B[:, -1].toarray()[:, 0]),
+                            FSR=None)
+    A_B = A_B.tocoo()
+    rounding = np.finfo(np.float64).eps
+    # Строки - словари столбец -> значение, для столбцов храним множества
+    # оставшихся строк с ненулевым элементом в них
+    rows: list[dict[int, float]] = [{} for _ in range(n)]
+    column_rows: list[set[int]] = [set() for _ in range(m)]
+    for i, j, value in zip(A_B.row, A_B.col, A_B.data):
+        if value != 0:
+            rows[i][j] = rows[i].get(j, 0.0) + float(value)
+    for i, row in enumerate(rows):
+        for j in row:
+            if j < m:
+                column_rows[j].add(i)
+    # Очередь столбцов по числу ненулевых элементов, устаревшие записи
+    # пропускаются
+    queue = [(len(column_rows[j]), j) for j in range(m)]
+    heapq.heapify(queue)
+    done = np.zeros(m, dtype=bool)
+    pivots: list[tuple[int, int]] = []
+    while queue:
+        count, col = heapq.heappop(queue)
+        if done[col] or count != len(column_rows[col]):
+            continue
+        done[col] = True
+        candidates = [i for i in column_rows[col]
+                      if abs(rows[i][col]) > tolerance]
+        # В столбце только нули, переменная свободная
+        if not candidates:
+            continue
+        max_value = max(abs(rows[i][col]) for i in candidates)
+        row = min((i for i in candidates
+                   if abs(rows[i][col]) >= threshold * max_value),
+                  key=lambda i: (len(rows[i]), -abs(rows[i][col])))
+        pivot_row = rows[row]
+        for j in pivot_row:
+            if j < m:
+                column_rows[j].discard(row)
+        for i in column_rows[col].copy():
+            factor = rows[i][col] / pivot_row[col]
+            for j, value in pivot_row.items():
+                old_value = rows[i].get(j, 0.0)
+                new_value = old_value - factor * value
+                # Не храним элементы, сократившиеся до ошибки округления
+                # самого вычитания
+                if j == col or abs(new_value) <= rounding * (
+                        abs(old_value) + abs(factor * value)):
+                    rows[i].pop(j, None)
+                    if j < m:
+                        column_rows[j].discard(i)
+                else:
+                    rows[i][j] = new_value
+                    if j < m:
+                        column_rows[j].add(i)
+        # Число элементов изменилось только в столбцах ведущей строки
+        for j in pivot_row:
+            if j < m and not done[j]:
+                heapq.heappush(queue, (len(column_rows[j]), j))
+        pivots.append((row, col))
+    pivot_rows = {row for row, _ in pivots}
+    # Нет решений: в строке без ведущего элемента ненулевая правая часть
+    if any(abs(rows[i].get(m, 0.0)) > rhs_tolerance
+           for i in range(n) if i not in pivot_rows):
+        return None
+    # Обратный ход: зависимая переменная выражается через свободные,
+    # ведущие строки обрабатываются в порядке, обратном исключению
+    B: dict[int, float] = {}
+    FSR: dict[int, dict[int, float]] = {}
+    for row, col in reversed(pivots):
+        pivot_value = rows[row][col]
+        value = rows[row].get(m, 0.0)
+        fsr_row: dict[int, float] = {}
+        for j, coeff in rows[row].items():
+            if j == col or j == m:
+                continue
+            if j in B:
+                value -= coeff * B[j]
+                for free, fsr_coeff in FSR[j].items():
+                    fsr_row[free] = fsr_row.get(free, 0.0) - coeff * fsr_coeff
+            else:
+                fsr_row[j] = fsr_row.get(j, 0.0) + coeff
+        B[col] = value / pivot_value
+        FSR[col] = {free: coeff / pivot_value
+                    for free, coeff in fsr_row.items()}
+    dependent = sorted(B)
+    free_variables = np.ones(m, dtype=np.int8)
+    free_variables[dependent] = 0
+    freedom_degrees = m - len(dependent)
+    if freedom_degrees == 0:
+        return Solution(single_flag=True, freedom_degrees=0,
+                        free_variables=None,
+                        B=np.array([B[col] for col in dependent]), FSR=None)
+    # Номера свободных переменных среди всех свободных
+    free_index = np.cumsum(free_variables) - 1
+    fsr_entries = [(i, free_index[free], coeff)
+                   for i, col in enumerate(dependent)
+                   for free, coeff in FSR[col].items()]
+    row_index, col_index, data = (zip(*fsr_entries) if fsr_entries
+                                  else ((), (), ()))
+    return Solution(single_flag=False, freedom_degrees=freedom_degrees,
+                    free_variables=free_variables,
+                    B=np.array([B[col] for col in dependent]),
+                    FSR=sparse.csr_matrix(
+                        (data, (row_index, col_index)),
+                        shape=(len(dependent), freedom_degrees)))
 
 
-def gauss_solver(A_B: np.ndarray) -> None | Solution:
+def blocked_gauss_solver(A_B: np.ndarray, block_size: int = 256,
+                         dtype: tp.Any = None) -> None | Solution:
     """
-    Функция решает систему линейных уравнений
-    :param A_B: Матрица СЛАУ
+    Функция решает систему линейных уравнений по блокам столбцов, не держа
+    всю матрицу в памяти: A_B может быть np.memmap, который приводится к
+    упрощенному ступенчатому виду на месте. В память читается очередная
+    панель из block_size столбцов, в ней выполняется метод Гаусса с выбором
+    максимального элемента, после чего остальные столбцы по блокам
+    обновляются одним решением системы для ведущих строк и одним умножением
+    матриц. Перестановки строк делаются на месте в загруженных блоках.
+    Пороги нуля относительны к норме матрицы, которая считается одним
+    дополнительным проходом по блокам. Нужно около 4 * n * block_size чисел
+    памяти
+    :param A_B: Матрица СЛАУ (np.ndarray или np.memmap)
+    :param block_size: Число столбцов в панели и в блоке обновления
+    :param dtype: Тип вычислений в загруженных блоках (np.float32 вдвое
+    экономит память). По умолчанию тип A_B. Блоки приводятся к нему при
+    чтении и записываются обратно в типе A_B, вся матрица не копируется
     :return: возвращает None в случае отсутствия решения и объект класса
     Solution в случае, если решение есть.
     """
-    n, m = A_B.shape[0], A_B.shape[1]
+    # Результат пишется в A_B на месте, в целочисленную матрицу его не
+    # записать без потерь
+    if not np.issubdtype(A_B.dtype, np.floating):
+        raise TypeError(f'A_B must be a floating matrix, got {A_B.dtype}')
+    if dtype is None:
+        dtype = A_B.dtype
+    n, m = A_B.shape[0], A_B.shape[1] - 1
+    # Норма матрицы системы по блокам, вся матрица в память не читается
+    squares = 0.0
+    for start in range(0, m, block_size):
+        block = np.array(A_B[:, start:min(start + block_size, m)],
+                         dtype=np.float64)
+        squares += np.einsum('ij,ij->', block, block)
+    tolerance, rhs_tolerance = _zero_thresholds(
+        (n, m), dtype, np.sqrt(squares),
+        np.linalg.norm(np.asarray(A_B[:, -1], dtype=np.float64)))
+    free_variables = np.ones(m, dtype=bool)
     row = 0
-    col = 0
-    # Массив для определения свободных переменных
-    free_variable_array = np.ones(m - 1)
-    # Идем по минимальной размерности матрицы (больше не пройдем)
-    for i in range(min(n, m - 1)):
-        # Вычисляем индекс максимального элемента в столбце
-        index_max_elem = row + np.argmax(np.abs(A_B[row:, col]))
-        # Переставляем строчку с максимальным элементом и нынешнюю строчку
-        A_B[[row, index_max_elem], :] = A_B[[index_max_elem, row], :]
-        # Проверка, что макс. значение не ноль
-        # (для машинной точности: >= 10**(-10))
-        if (np.abs(max_value := A_B[row, col])) >= 10**(-10):
-            A_B[row, :] = A_B[row, :] / max_value
-            # Прямой и обратный ход Гаусса
-            for change_index in range(n):
-                if change_index != row:
-                    A_B[change_index, col:] -= (A_B[change_index, col] *
-                                                A_B[row, col:])
-            # Переменная с номером col не свободная (зависимая)
-            free_variable_array[col] = 0
-            #  Обновляем номер строки и столбца
+    for start in range(0, m, block_size):
+        if row == n:
+            break
+        stop = min(start + block_size, m)
+        panel = np.array(A_B[:, start:stop], dtype=dtype)
+        first_row = row
+        swaps: list[tuple[int, int]] = []
+        pivot_columns: list[int] = []
+        for col in range(stop - start):
+            if row == n:
+                break
+            index_max_elem = row + np.argmax(np.abs(panel[row:, col]))
+            if np.abs(panel[index_max_elem, col]) <= tolerance:
+                # Переменная свободная, оставшиеся в столбце нули зануляем
+                # точно, тогда левые столбцы не зависят от перестановок
+                panel[row:, col] = 0
+                continue
+            if index_max_elem != row:
+                _swap_rows(panel, row, index_max_elem)
+                swaps.append((row, index_max_elem))
+            panel[row, col:] /= panel[row, col]
+            factors = panel[:, col].copy()
+            factors[row] = 0
+            panel[:, col:] -= factors[:, np.newaxis] * panel[row, col:]
+            pivot_columns.append(col)
+            free_variables[start + col] = False
             row += 1
-            col += 1
-        else:
-            # В столбце только нули, смотрим следующий столбец
-            # в следующей итерации
-            col += 1
+        if pivot_columns:
+            # Столбцы панели при зависимых переменных до исключения: все
+            # преобразования панели - комбинации ведущих строк, поэтому
+            # остальные столбцы преобразуются так же
+            original = np.array(A_B[:, start:stop][:, pivot_columns],
+                                dtype=dtype)
+            for a, b in swaps:
+                _swap_rows(original, a, b)
+            pivot_rows = slice(first_row, row)
+            pivot_block = original[pivot_rows].copy()
+            original[pivot_rows] = 0
+        A_B[:, start:stop] = panel
+        del panel
+        if not pivot_columns:
             continue
-    # Нет решений
-    if np.any(np.where(np.abs(A_B[row:, -1]) >= 10**(-15))[0]):
+        for block in range(stop, m + 1, block_size):
+            chunk = np.array(A_B[:, block:block + block_size], dtype=dtype)
+            for a, b in swaps:
+                _swap_rows(chunk, a, b)
+            chunk[pivot_rows] = np.linalg.solve(pivot_block,
+                                                chunk[pivot_rows])
+            chunk -= original @ chunk[pivot_rows]
+            A_B[:, block:block + block_size] = chunk
+    # Нет решений: в нулевой строке ненулевая правая часть
+    if np.any(np.abs(A_B[row:, -1]) > rhs_tolerance):
         return None
-    # Решение одно
-    elif np.sum(free_variable_array) == m - 1:
+    freedom_degrees = int(np.sum(free_variables))
+    B = np.array(A_B[:row, -1], dtype=dtype)
+    if freedom_degrees == 0:
         return Solution(single_flag=True, freedom_degrees=0,
-                        free_variables=None, B=A_B[:, -1], FSR=None)
-    # Бесконечно решений
-    else:
+                        free_variables=None, B=B, FSR=None)
+    return Solution(single_flag=False, freedom_degrees=freedom_degrees,
+                    free_variables=free_variables.astype(np.int8), B=B,
+                    FSR=np.array(A_B[:row, :-1][:, free_variables],
+                                 dtype=dtype))
+
+
+def _swap_rows(a: np.ndarray, i: int, j: int) -> None:
+    """
+    Переставляет две строки массива на месте через буфер в одну строку
+    :param a: Массив
+    :param i: Номер первой строки
+    :param j: Номер второй строки
+    :return: None
+    """
+    buffer = a[i].copy()
+    a[i] = a[j]
+    a[j] = buffer
+
+
+class LUFactorization:
+    """
+    Разложение P A = L U матрицы СЛАУ методом Гаусса с выбором максимального
+    элемента в столбце. Разложение вычисляется один раз, после чего каждая
+    правая часть решается за O(n^2) прямой и обратной подстановкой. ФСР
+    зависит только от матрицы, поэтому тоже вычисляется один раз и общая для
+    всех решений
+    """
+    def __init__(self, A: np.ndarray):
+        A = np.array(A, dtype=np.result_type(A.dtype, np.float64))
+        n, m = A.shape
+        tolerance, _ = _zero_thresholds(A.shape, A.dtype, np.linalg.norm(A),
+                                        0)
+        permutation = np.arange(n)
+        L = np.zeros((n, min(n, m)), dtype=A.dtype)
+        free_variables = np.ones(m, dtype=bool)
+        row = 0
+        for col in range(m):
+            if row == n:
+                break
+            # Индекс максимального элемента в столбце среди оставшихся строк
+            index_max_elem = row + np.argmax(np.abs(A[row:, col]))
+            # В столбце только нули, переменная свободная
+            if np.abs(A[index_max_elem, col]) <= tolerance:
+                continue
+            if index_max_elem != row:
+                A[[row, index_max_elem]] = A[[index_max_elem, row]]
+                L[[row, index_max_elem]] = L[[index_max_elem, row]]
+                permutation[[row, index_max_elem]] = \
+                    permutation[[index_max_elem, row]]
+            # Исключение только в строках ниже ведущей, множители
+            # запоминаются в L
+            factors = A[row + 1:, col] / A[row, col]
+            A[row + 1:, col:] -= factors[:, np.newaxis] * A[row, col:]
+            A[row + 1:, col] = 0
+            L[row + 1:, row] = factors
+            free_variables[col] = False
+            row += 1
+        self._rank = row
+        self._permutation = permutation
+        self._L = L[:, :row]
+        # Ступенчатая матрица U: ее столбцы при зависимых и при свободных
+        # переменных
+        U = A[:row]
+        self._U_pivot = U[:, ~free_variables]
+        self._free_variables = free_variables
+        self._freedom_degrees = int(np.sum(free_variables))
+        self._FSR = (_back_substitution(self._U_pivot, U[:, free_variables])
+                     if self._freedom_degrees else None)
+
+    def rank(self) -> int:
+        """
+        Возвращает ранг матрицы системы
+        :return: Ранг (число зависимых переменных)
+        """
+        return self._rank
+
+    def solve(self, b: np.ndarray) -> None | Solution | list[None | Solution]:
+        """
+        Решает систему с новой правой частью
+        :param b: Вектор правой части (n,) или матрица (n, k) из k правых
+        частей
+        :return: None в случае отсутствия решения и объект класса Solution в
+        случае, если решение есть. Для матрицы правых частей - список из k
+        таких значений
+        """
+        rhs = np.asarray(b, dtype=self._L.dtype).reshape(
+            self._permutation.shape[0], -1)
+        y = _forward_substitution(self._L, rhs[self._permutation])
+        # Нет решений: после исключения в нулевых строках ненулевая правая
+        # часть (порог своей для каждой правой части)
+        _, tolerance = _zero_thresholds(
+            (rhs.shape[0], self._free_variables.shape[0]), rhs.dtype, 0,
+            np.linalg.norm(rhs, axis=0))
+        consistent = np.all(np.abs(y[self._rank:]) <= tolerance, axis=0)
+        B = np.ascontiguousarray(
+            _back_substitution(self._U_pivot, y[:self._rank]).T)
+        solutions = [self._solution(B[i]) if consistent[i] else None
+                     for i in range(rhs.shape[1])]
+        return solutions[0] if np.ndim(b) == 1 else solutions
+
+    def _solution(self, B: np.ndarray) -> Solution:
+        """
+        Вспомогательная функция, собирающая решение для одной правой части
+        :param B: Значения зависимых переменных при нулевых свободных
+        :return: объект Solution
+        """
+        if self._freedom_degrees == 0:
+            return Solution(single_flag=True, freedom_degrees=0,
+                            free_variables=None, B=B, FSR=None)
         return Solution(single_flag=False,
-                        freedom_degrees=np.sum(free_variable_array),
-                        free_variables=free_variable_array, B=A_B[:, -1],
-                        FSR=A_B[:, np.where(free_variable_array == 1)[0]])
+                        freedom_degrees=self._freedom_degrees,
+                        free_variables=self._free_variables.astype(np.int8),
+                        B=B, FSR=self._FSR)
+
+
+def _forward_substitution(L: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Прямая подстановка для нижнетреугольной матрицы с единицами на диагонали
+    (столбцы L ниже r строк тоже учитываются, так что в строках r: остаются
+    невязки)
+    :param L: Матрица (n, r) множителей исключения
+    :param b: Правые части (n, k), не изменяются
+    :return: Решение (n, k)
+    """
+    y = b.copy()
+    for j in range(L.shape[1]):
+        y[j + 1:] -= L[j + 1:, j, np.newaxis] * y[j]
+    return y
+
+
+def _back_substitution(U: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Обратная подстановка для верхнетреугольной матрицы
+    :param U: Верхнетреугольная матрица (r, r)
+    :param b: Правые части (r, k), не изменяются
+    :return: Решение (r, k)
+    """
+    x = b.copy()
+    for j in range(U.shape[0] - 1, -1, -1):
+        x[j] /= U[j, j]
+        x[:j] -= U[:j, j, np.newaxis] * x[j]
+    return x
 
 
 def task_1_2():
@@ -145,25 +667,118 @@ def task_1_2():
 ###################
 
 
-def gcd(n_m: np.ndarray) -> np.ndarray:
+def gcd(n_m: np.ndarray, method: str = 'euclid', chunk_size: int = 2**20,
+        workers: int = 1, out: np.ndarray | None = None) -> np.ndarray:
     """
     Функция вычисляет НОД для каждой строки для вектора (n, 2) с помощью
-    алгоритма Евклида
+    алгоритма Евклида (или бинарного алгоритма Стейна). Массив
+    обрабатывается кусками по chunk_size строк, так что дополнительная
+    память ограничена размером куска на поток; куски считаются в workers
+    потоках (операции numpy отпускают GIL). Входной массив может быть
+    np.memmap
     :param n_m: np.ndarray с парами чисел, для которых требуется найти НОД
-    :return: np.ndarray размером (n, 1), в котором хранятся НОД для всех
+    :param method: 'euclid' - алгоритм Евклида, 'binary' - бинарный
+    алгоритм без деления (только для неотрицательных целых чисел, они
+    приводятся к np.uint64). Для другого значения возбуждается ValueError
+    :param chunk_size: Число строк в куске
+    :param workers: Число потоков
+    :param out: Массив (n,) для результата
+    :return: np.ndarray размером (n,), в котором хранятся НОД для всех
     пар в начальном массиве
     """
-    answer = n_m.copy()
-    while True:
-        # Маска для строк, у которых во втором столбце не ноль
-        mask = np.where(answer[:, 1] != 0)[0]
-        # Когда везде нули во втором столбце, мы нашли все НОД
-        if not np.any(answer[:, 1]):
-            return answer[:, 0]
-        answer[mask] = np.concatenate(
-            (answer[mask, 1].reshape((mask.shape[0], 1)),
-             (answer[mask, 0] % answer[mask, 1]).reshape((mask.shape[0], 1))),
-            axis=1)
+    if method not in ('euclid', 'binary'):
+        raise ValueError(f"method must be 'euclid' or 'binary', "
+                         f"got {method!r}")
+    binary = method == 'binary'
+    if binary and not np.issubdtype(n_m.dtype, np.integer):
+        raise ValueError(f'binary gcd needs integers, got {n_m.dtype}')
+    engine = _gcd_binary if binary else _gcd_euclid
+    dtype = np.uint64 if binary else n_m.dtype
+    # Знаковые числа проверяются по кускам, чтобы не читать массив дважды
+    signed = binary and np.issubdtype(n_m.dtype, np.signedinteger)
+    n = n_m.shape[0]
+    if out is None:
+        out = np.empty(n, dtype=dtype)
+
+    def solve_chunk(start: int) -> None:
+        pairs = np.array(n_m[start:start + chunk_size])
+        if signed and np.any(pairs < 0):
+            raise ValueError('binary gcd needs non-negative numbers')
+        # Неотрицательные int64 совпадают с uint64 побитово
+        pairs = (pairs.view(dtype) if pairs.dtype.itemsize == 8
+                 else pairs.astype(dtype))
+        out[start:start + chunk_size] = engine(pairs[:, 0], pairs[:, 1])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list нужен, чтобы исключения из потоков не потерялись
+        list(executor.map(solve_chunk, range(0, n, chunk_size)))
+    return out
+
+
+def _gcd_euclid(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Алгоритм Евклида по активному множеству: после каждого шага пары с
+    найденным НОД убираются, так что следующий шаг считается только для
+    оставшихся
+    :param a: Первые числа пар
+    :param b: Вторые числа пар
+    :return: НОД пар
+    """
+    answer = np.empty_like(a)
+    # Номера еще не решенных пар в исходном массиве
+    index = np.arange(a.shape[0])
+    while index.size:
+        # Когда во втором числе ноль, НОД найден
+        done = b == 0
+        answer[index[done]] = a[done]
+        if done.any():
+            active = ~done
+            a, b, index = a[active], b[active], index[active]
+        a, b = b, a % b
+    return answer
+
+
+def _gcd_binary(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Бинарный алгоритм Стейна для np.uint64 по активному множеству: вместо
+    деления используются сдвиги и вычитания
+    :param a: Первые числа пар
+    :param b: Вторые числа пар
+    :return: НОД пар
+    """
+    answer = np.empty_like(a)
+    # Если одно из чисел 0, НОД равен другому числу
+    zero = (a == 0) | (b == 0)
+    answer[zero] = a[zero] | b[zero]
+    index = np.flatnonzero(~zero)
+    a, b = a[index], b[index]
+    # Общая степень двойки
+    shift = _trailing_zeros(a | b)
+    a >>= _trailing_zeros(a)
+    while index.size:
+        b >>= _trailing_zeros(b)
+        # Теперь оба числа нечетные, из большего вычитаем меньшее
+        a, b = np.minimum(a, b), np.maximum(a, b)
+        b -= a
+        done = b == 0
+        if done.any():
+            answer[index[done]] = a[done] << shift[done]
+            active = ~done
+            a, b = a[active], b[active]
+            index, shift = index[active], shift[active]
+    return answer
+
+
+def _trailing_zeros(x: np.ndarray) -> np.ndarray:
+    """
+    Число нулевых младших битов ненулевых np.uint64
+    :param x: Массив чисел
+    :return: Массив np.uint64 с числом нулей
+    """
+    # Младший единичный бит - степень двойки, она точно представима во
+    # float64, и ее показатель дает frexp
+    lowest_bit = x & (~x + np.uint64(1))
+    return (np.frexp(lowest_bit.astype(np.float64))[1] - 1).astype(np.uint64)
 
 
 def task_3():
@@ -179,42 +794,113 @@ def task_3():
 ###################
 
 
-def broadcaster(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+def broadcaster(a: np.ndarray, b: np.ndarray, ufunc: np.ufunc = np.add,
+                out: np.ndarray | None = None,
+                chunk_size: int | None = None) -> np.ndarray:
     """
-    Функция складывает два np.ndarray, реализуя обобщенный broadcast.
+    Функция применяет бинарную ufunc к двум np.ndarray, реализуя обобщенный
+    broadcast.
     Отличие обобщенного от классического в том, что если по какому-то измерению
     число меньшее число элементов делит нацело большее, то мы его применяем
-    циклически.
+    циклически. Копии массивов не создаются: измерение большего массива
+    разбивается на два (число повторов, длина меньшего), а у меньшего
+    добавляется измерение длины 1, дальше работает обычный broadcast
+    :param a: Первый массив np.ndarray
+    :param b: Второй массив np.ndarray
+    :param ufunc: Бинарная ufunc (по умолчанию np.add)
+    :param out: Массив для результата
+    :param chunk_size: Если задан, результат вычисляется кусками по первому
+    измерению (удобно для out в np.memmap)
+    :return: Результат ufunc(a, b) с обобщенным broadcast
+    """
+    a_view, b_view, shape = _cyclic_views(a, b)
+    if not shape:
+        return ufunc(a_view, b_view, out=out)
+    if out is None:
+        out = np.empty(shape, dtype=ufunc(a_view[:0], b_view[:0]).dtype)
+    # Разбиение измерений на два всегда возможно без копирования
+    out_view = out.reshape(np.broadcast_shapes(a_view.shape, b_view.shape))
+    rows = out_view.shape[0]
+    step = rows if chunk_size is None else max(1, chunk_size)
+    for start in range(0, rows, step):
+        ufunc(_rows(a_view, start, start + step),
+              _rows(b_view, start, start + step),
+              out=out_view[start:start + step])
+    return out
+
+
+def broadcaster_chunks(a: np.ndarray, b: np.ndarray,
+                       ufunc: np.ufunc = np.add, chunk_size: int = 1024) \
+        -> tp.Iterator[tuple[slice, np.ndarray]]:
+    """
+    Генератор результата обобщенного broadcast по кускам первого измерения,
+    когда весь результат не нужен в памяти сразу
     :param a: Первый массив np.ndarray
     :param b: Второй массив np.ndarray
-    :return: Сумма a и b с обобщенным broadcast
-    """
-    num_of_dims = np.max((len(a.shape), len(b.shape)))
-    #  Запоминаем начальные размеры
-    a_shape = np.copy(a.shape).astype(np.int16)
-    b_shape = np.copy(b.shape).astype(np.int16)
-    if len(a_shape) > len(b_shape):
-        b_shape = np.concatenate((b_shape,
-                                  np.ones(len(a_shape) - len(b_shape),
-                                          dtype=np.int16)), dtype=np.int16)
-        b = b.reshape(b_shape)
-    else:
-        a_shape = np.concatenate((a_shape,
-                                  np.ones(len(b_shape) - len(a_shape),
-                                          dtype=np.int16)), dtype=np.int16)
-        a = a.reshape(a_shape)
-    # Идем по максимальной размерности и множим минимальный массив
-    # для данной размерности
-    for dim in range(num_of_dims):
-        if a_shape[dim] < b_shape[dim] and b_shape[dim] % a_shape[dim] == 0:
-            list_ = np.ones(num_of_dims, dtype=np.int16)
-            list_[dim] = b_shape[dim] // a_shape[dim]
-            a = np.tile(a, list_)
-        elif a_shape[dim] > b_shape[dim] and a_shape[dim] % b_shape[dim] == 0:
-            list_ = np.ones(num_of_dims, dtype=np.int16)
-            list_[dim] = a_shape[dim] // b_shape[dim]
-            b = np.tile(b, list_)
-    return a + b
+    :param ufunc: Бинарная ufunc (по умолчанию np.add)
+    :param chunk_size: Число строк первого измерения разбитых массивов в
+    куске
+    :return: пары (срез первого измерения результата, кусок результата);
+    для скалярного результата - одна пара (slice(None), результат)
+    """
+    a_view, b_view, shape = _cyclic_views(a, b)
+    if not shape:
+        # У скаляра нет первого измерения, делить нечего
+        yield slice(None), ufunc(a_view, b_view)
+        return
+    split_shape = np.broadcast_shapes(a_view.shape, b_view.shape)
+    # Число строк результата в одной строке разбитых массивов
+    period = shape[0] // split_shape[0] if split_shape[0] else 1
+    for start in range(0, split_shape[0], chunk_size):
+        block = ufunc(_rows(a_view, start, start + chunk_size),
+                      _rows(b_view, start, start + chunk_size))
+        yield (slice(start * period, start * period + block.shape[0] * period),
+               block.reshape(-1, *shape[1:]))
+
+
+def _cyclic_views(a: np.ndarray, b: np.ndarray) \
+        -> tuple[np.ndarray, np.ndarray, tuple[int, ...]]:
+    """
+    Вспомогательная функция, строящая представления массивов, для которых
+    обобщенный broadcast сводится к обычному
+    :param a: Первый массив np.ndarray
+    :param b: Второй массив np.ndarray
+    :return: представления a и b и форма результата
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    num_of_dims = max(a.ndim, b.ndim)
+    # Недостающие измерения добавляются в конец
+    a = a.reshape(a.shape + (1,) * (num_of_dims - a.ndim))
+    b = b.reshape(b.shape + (1,) * (num_of_dims - b.ndim))
+    a_shape: list[int] = []
+    b_shape: list[int] = []
+    shape: list[int] = []
+    for a_dim, b_dim in zip(a.shape, b.shape):
+        small, big = sorted((a_dim, b_dim))
+        if a_dim == b_dim or small == 1:
+            a_shape.append(a_dim)
+            b_shape.append(b_dim)
+        elif small == 0 or big % small:
+            raise ValueError(f'shapes {a.shape} and {b.shape} cannot be '
+                             f'broadcast')
+        else:
+            # Большее измерение - (число повторов, длина меньшего)
+            a_shape += [1, a_dim] if a_dim == small else [big // small, small]
+            b_shape += [1, b_dim] if b_dim == small else [big // small, small]
+        shape.append(big)
+    return a.reshape(a_shape), b.reshape(b_shape), tuple(shape)
+
+
+def _rows(x: np.ndarray, start: int, stop: int) -> np.ndarray:
+    """
+    Строки start:stop первого измерения (измерение длины 1 не режется,
+    оно растягивается broadcast)
+    :param x: Массив
+    :param start: Первая строка
+    :param stop: Строка после последней
+    :return: Представление строк
+    """
+    return x if x.shape[0] == 1 else x[start:stop]
 
 
 def task_4():
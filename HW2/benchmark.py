@@ -0,0 +1,351 @@
+import argparse
+import json
+import math
+import statistics
+import sys
+import timeit
+import tracemalloc
+import typing as tp
+
+import numpy as np
+
+from Numpy_HW import broadcaster, gauss_solver, gcd
+
+# Реализации модуля; остальные строки отчета - эталоны numpy, с которыми
+# они сравниваются в том же запуске
+IMPLEMENTATIONS = {'gauss_solver', 'gcd euclid', 'gcd binary', 'broadcaster'}
+
+
+def measure(function: tp.Callable[[], tp.Any], repeat: int) \
+        -> tuple[tp.Any, float, int]:
+    """
+    Measures a function: the median time of one call over repeat rounds and
+    the peak of the memory allocated during one more call. Each round calls
+    the function as many times as it takes to run for at least 0.2 seconds
+    (timeit.Timer.autorange), so short calls are not lost in the resolution
+    of the timer and in the noise of the machine
+    :param function: the measured function without arguments
+    :param repeat: number of the timed rounds
+    :return: result of the function, time of one call in seconds and peak
+    memory in bytes
+    """
+    timer = timeit.Timer(function)
+    times = []
+    for _ in range(repeat):
+        number, seconds = timer.autorange()
+        times.append(seconds / number)
+    # Отслеживание памяти замедляет работу, поэтому отдельный запуск
+    tracemalloc.start()
+    try:
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, statistics.median(times), peak
+
+
+def record(routine: str, case: str, size: int, implementation: str,
+           function: tp.Callable[[], tp.Any], residual: tp.Callable,
+           repeat: int) -> dict:
+    """
+    One line of the report; the case is failed if the function found no
+    answer (returned None), its residual is then infinite
+    :param routine: the name of the measured routine
+    :param case: the kind of the input
+    :param size: the size of the input
+    :param implementation: the name of the implementation
+    :param function: the measured function without arguments
+    :param residual: function of the result giving its error
+    :param repeat: number of the timed rounds
+    :return: the measurements
+    """
+    result, seconds, peak = measure(function, repeat)
+    error = math.inf if result is None else float(residual(result))
+    return {'routine': routine, 'case': case, 'size': size,
+            'implementation': implementation, 'time': seconds,
+            'peak_memory': peak, 'residual': error,
+            'failed': result is None or not math.isfinite(error)}
+
+
+def particular(solution: tp.Any) -> np.ndarray | None:
+    """
+    The particular solution of gauss_solver with zero free variables
+    :param solution: the result of gauss_solver for one system
+    :return: the solution or None if the system has no solution
+    """
+    if solution is None:
+        return None
+    return solution.solutions()(np.zeros(solution.freedom_degrees()))
+
+
+def bench_gauss(sizes: list[int], repeat: int,
+                rng: np.random.Generator) -> list[dict]:
+    """
+    gauss_solver against np.linalg.solve (full rank), np.linalg.lstsq (rank
+    deficient) and the stacked np.linalg.solve (many small systems)
+    :param sizes: numbers of unknowns
+    :param repeat: number of the timed rounds
+    :param rng: generator of the inputs
+    :return: lines of the report
+    """
+    results = []
+    for n in sizes:
+        A = rng.uniform(low=1, high=50, size=(n, n))
+        b = rng.uniform(low=1, high=50, size=n)
+        A_B = np.column_stack((A, b))
+
+        def residual(x: np.ndarray) -> float:
+            return np.max(np.abs(A @ x - b))
+
+        results += [
+            record('gauss', 'square', n, 'gauss_solver',
+                   lambda: particular(gauss_solver(A_B.copy())),
+                   residual, repeat),
+            record('gauss', 'square', n, 'np.linalg.solve',
+                   lambda: np.linalg.solve(A, b), residual, repeat)]
+        # Совместная система ранга n / 2
+        A = (rng.uniform(low=1, high=50, size=(n, max(1, n // 2)))
+             @ rng.uniform(size=(max(1, n // 2), n)))
+        b = A @ rng.uniform(size=n)
+        A_B = np.column_stack((A, b))
+        results += [
+            record('gauss', 'rank_deficient', n, 'gauss_solver',
+                   lambda: particular(gauss_solver(A_B.copy())),
+                   residual, repeat),
+            record('gauss', 'rank_deficient', n, 'np.linalg.lstsq',
+                   lambda: np.linalg.lstsq(A, b, rcond=None)[0], residual,
+                   repeat)]
+        # Много маленьких систем 8 x 8
+        A = rng.uniform(low=1, high=50, size=(n * 10, 8, 8))
+        b = rng.uniform(low=1, high=50, size=(n * 10, 8))
+        A_B = np.concatenate((A, b[:, :, np.newaxis]), axis=2)
+
+        def batch_residual(x: np.ndarray) -> float:
+            return np.max(np.abs(np.einsum('kij,kj->ki', A, x) - b))
+
+        def batch_particular(solutions: list) -> np.ndarray | None:
+            # Нет ответа у всего набора, если нет решения хотя бы у одной
+            # системы
+            x = [particular(solution) for solution in solutions]
+            return None if any(item is None for item in x) else np.array(x)
+
+        results += [
+            record('gauss', 'batch_8x8', n * 10, 'gauss_solver',
+                   lambda: batch_particular(gauss_solver(A_B.copy())),
+                   batch_residual, repeat),
+            record('gauss', 'batch_8x8', n * 10, 'np.linalg.solve',
+                   lambda: np.linalg.solve(A, b[:, :, np.newaxis])[..., 0],
+                   batch_residual, repeat)]
+    return results
+
+
+def bench_gcd(sizes: list[int], repeat: int,
+              rng: np.random.Generator) -> list[dict]:
+    """
+    gcd (Euclid and binary) against np.gcd
+    :param sizes: numbers of pairs
+    :param repeat: number of the timed rounds
+    :param rng: generator of the inputs
+    :return: lines of the report
+    """
+    results = []
+    for n in sizes:
+        n_m = rng.integers(low=0, high=2**62, size=(n, 2), dtype=np.uint64)
+        expected = np.gcd(n_m[:, 0], n_m[:, 1])
+
+        def residual(answer: np.ndarray) -> int:
+            return np.count_nonzero(answer != expected)
+
+        results += [
+            record('gcd', 'uint64', n, 'gcd euclid', lambda: gcd(n_m),
+                   residual, repeat),
+            record('gcd', 'uint64', n, 'gcd binary',
+                   lambda: gcd(n_m, method='binary'), residual, repeat),
+            record('gcd', 'uint64', n, 'np.gcd',
+                   lambda: np.gcd(n_m[:, 0], n_m[:, 1]), residual, repeat)]
+    return results
+
+
+def bench_broadcaster(sizes: list[int], repeat: int,
+                      rng: np.random.Generator) -> list[dict]:
+    """
+    broadcaster against native broadcasting (classic shapes) and against
+    np.tile with native addition (cyclic shapes)
+    :param sizes: lengths of the axes
+    :param repeat: number of the timed rounds
+    :param rng: generator of the inputs
+    :return: lines of the report
+    """
+    results = []
+    for n in sizes:
+        a = rng.uniform(size=(n, 1))
+        b = rng.uniform(size=(1, n))
+        expected = a + b
+        results += [
+            record('broadcaster', 'classic', n, 'broadcaster',
+                   lambda: broadcaster(a, b),
+                   lambda c: np.max(np.abs(c - expected)), repeat),
+            record('broadcaster', 'classic', n, 'numpy',
+                   lambda: a + b,
+                   lambda c: np.max(np.abs(c - expected)), repeat)]
+        # Циклический broadcast: 4 повтора по каждому измерению
+        a = rng.uniform(size=(n // 4 or 1, n))
+        b = rng.uniform(size=(n, n // 4 or 1))
+        expected = np.tile(a, (n // a.shape[0], 1)) + \
+            np.tile(b, (1, n // b.shape[1]))
+        results += [
+            record('broadcaster', 'cyclic', n, 'broadcaster',
+                   lambda: broadcaster(a, b),
+                   lambda c: np.max(np.abs(c - expected)), repeat),
+            record('broadcaster', 'cyclic', n, 'np.tile',
+                   lambda: np.tile(a, (n // a.shape[0], 1))
+                   + np.tile(b, (1, n // b.shape[1])),
+                   lambda c: np.max(np.abs(c - expected)), repeat)]
+    return results
+
+
+def reference_times(results: list[dict]) -> dict[tuple, float]:
+    """
+    Times of the numpy references
+    :param results: lines of a report
+    :return: dictionary (routine, case, size) -> time of the reference
+    """
+    return {(line['routine'], line['case'], line['size']): line['time']
+            for line in results
+            if line['implementation'] not in IMPLEMENTATIONS}
+
+
+def relative_times(results: list[dict]) -> dict[tuple, float]:
+    """
+    Times of the module implementations relative to the numpy reference
+    measured in the same run on the same input; the ratio does not depend
+    on the speed of the machine and on its load as much as the time itself
+    :param results: lines of a report
+    :return: dictionary (routine, case, size, implementation) -> time of
+    the implementation / time of the reference
+    """
+    references = reference_times(results)
+    return {(line['routine'], line['case'], line['size'],
+             line['implementation']):
+            line['time'] / max(references[line['routine'], line['case'],
+                                          line['size']], 1e-9)
+            for line in results
+            if line['implementation'] in IMPLEMENTATIONS
+            and (line['routine'], line['case'], line['size']) in references}
+
+
+def compare(results: list[dict], baseline_file: str, tolerance: float,
+            min_reference: float) -> list[str]:
+    """
+    Compares the relative times of the module implementations with a
+    previous report (possibly made on another machine). Cases with a
+    reference faster than min_reference in either report are not compared:
+    the ratio to a fraction of a millisecond is mostly noise
+    :param results: lines of the current report
+    :param baseline_file: the file of the previous report
+    :param tolerance: allowed ratio of the current relative time to the
+    previous one
+    :param min_reference: the shortest time of the reference in seconds
+    that is compared
+    :return: descriptions of the regressions
+    """
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline_results = json.load(f)['results']
+    baseline = relative_times(baseline_results)
+    references = reference_times(results)
+    baseline_references = reference_times(baseline_results)
+    regressions = []
+    for key, ratio in relative_times(results).items():
+        if min(references[key[:3]],
+               baseline_references.get(key[:3], 0.0)) < min_reference:
+            continue
+        if key in baseline and ratio > tolerance * baseline[key]:
+            regressions.append(f'{" ".join(map(str, key))}: '
+                               f'{ratio:.2f}x of numpy against '
+                               f'{baseline[key]:.2f}x')
+    return regressions
+
+
+BENCHMARKS = {'gauss': bench_gauss, 'gcd': bench_gcd,
+              'broadcaster': bench_broadcaster}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='benchmark',
+        description='Benchmark of gauss_solver, gcd and broadcaster against '
+                    'numpy: time, peak memory and residuals for a sweep of '
+                    'sizes as JSON')
+    parser.add_argument('--routines', nargs='+', choices=[*BENCHMARKS],
+                        default=[*BENCHMARKS],
+                        help='Routines to measure. Default = all')
+    parser.add_argument('--gauss_sizes', nargs='+', type=int,
+                        default=[50, 100, 200],
+                        help='Numbers of unknowns. Default = 50 100 200')
+    parser.add_argument('--gcd_sizes', nargs='+', type=int,
+                        default=[10**4, 10**5, 10**6],
+                        help='Numbers of pairs. Default = 10^4 10^5 10^6')
+    parser.add_argument('--broadcast_sizes', nargs='+', type=int,
+                        default=[100, 1000, 4000],
+                        help='Lengths of the axes. Default = 100 1000 4000')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of the timed rounds of at least 0.2 '
+                             'seconds each, the median one is reported. '
+                             'Default = 5')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Seed of the inputs. Default = 42')
+    parser.add_argument('--out', type=str, default=None,
+                        help='The file for the JSON report. '
+                             'Default = standard output')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='A previous report: the run fails if the time '
+                             'of some implementation of the module relative '
+                             'to numpy grew more than --tolerance times')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Allowed ratio to the baseline relative times. '
+                             'Default = 1.5')
+    parser.add_argument('--min_reference', type=float, default=0.005,
+                        help='Cases whose numpy reference takes less seconds '
+                             'are not compared with the baseline. '
+                             'Default = 0.005')
+    args = parser.parse_args()
+    sizes = {'gauss': args.gauss_sizes, 'gcd': args.gcd_sizes,
+             'broadcaster': args.broadcast_sizes}
+    results = []
+    for routine in args.routines:
+        # Свой генератор у каждой процедуры, чтобы входы не зависели от
+        # набора измеряемых процедур
+        rng = np.random.default_rng([args.seed, [*BENCHMARKS].index(routine)])
+        results += BENCHMARKS[routine](sizes[routine], args.repeat, rng)
+    ratios = relative_times(results)
+    for line in results:
+        key = (line['routine'], line['case'], line['size'],
+               line['implementation'])
+        if key in ratios:
+            line['relative_time'] = ratios[key]
+    report = json.dumps({'seed': args.seed, 'numpy': np.__version__,
+                         'results': results}, indent=2)
+    if args.out:
+        with open(args.out, mode='w', encoding='utf-8') as f:
+            print(report, file=f)
+    else:
+        print(report)
+    failed = [f"{line['routine']} {line['case']} {line['size']} "
+              f"{line['implementation']}" for line in results
+              if line['failed']]
+    if failed:
+        print('Failed cases (no answer or infinite residual):', *failed,
+              sep='\n', file=sys.stderr)
+    regressions = []
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance,
+                              args.min_reference)
+        if regressions:
+            print('Performance regressions:', *regressions, sep='\n',
+                  file=sys.stderr)
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
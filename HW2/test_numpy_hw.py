@@ -0,0 +1,179 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from Numpy_HW import (LUFactorization, blocked_gauss_solver, gauss_solver,
+                      sparse)
+
+
+def rank_deficient(rng: np.random.Generator, n: int) \
+        -> tuple[np.ndarray, np.ndarray]:
+    """
+    Consistent system of rank n / 2 with a positive matrix
+    :param rng: generator of the inputs
+    :param n: number of equations and unknowns
+    :return: the matrix and the right-hand side
+    """
+    A = (rng.uniform(low=1, high=50, size=(n, n // 2))
+         @ rng.uniform(size=(n // 2, n)))
+    return A, A @ rng.uniform(size=n)
+
+
+class SolverTestCase(unittest.TestCase):
+    def assertSolves(self, A: np.ndarray, b: np.ndarray, solution,
+                     freedom_degrees: int | None = None) -> None:
+        """
+        Checks that the solution exists and a random particular solution
+        satisfies the system
+        :param A: the matrix of the system
+        :param b: the right-hand side
+        :param solution: the result of a solver
+        :param freedom_degrees: the expected number of free variables
+        :return: None
+        """
+        self.assertIsNotNone(solution)
+        if freedom_degrees is not None:
+            self.assertEqual(solution.freedom_degrees(), freedom_degrees)
+        x = solution.solutions()(
+            np.random.default_rng(0).uniform(
+                size=solution.freedom_degrees()))
+        residual = np.linalg.norm(A @ x - b)
+        self.assertLessEqual(residual, 1e-8 * np.linalg.norm(b))
+
+
+class GaussSolverTest(SolverTestCase):
+    def test_full_rank(self) -> None:
+        rng = np.random.default_rng(1)
+        A = rng.uniform(low=1, high=50, size=(50, 50))
+        b = rng.uniform(low=1, high=50, size=50)
+        self.assertSolves(A, b, gauss_solver(np.column_stack((A, b))), 0)
+
+    def test_rank_deficient(self) -> None:
+        rng = np.random.default_rng(2)
+        for n in (20, 100, 200):
+            for _ in range(5):
+                A, b = rank_deficient(rng, n)
+                self.assertSolves(A, b, gauss_solver(np.column_stack((A, b))),
+                                  n - n // 2)
+
+    def test_inconsistent(self) -> None:
+        rng = np.random.default_rng(3)
+        A, b = rank_deficient(rng, 100)
+        b += rng.uniform(size=100)
+        self.assertIsNone(gauss_solver(np.column_stack((A, b))))
+
+    def test_scale_invariance(self) -> None:
+        rng = np.random.default_rng(4)
+        A = rng.normal(size=(30, 30)) + 30 * np.eye(30)
+        b = rng.normal(size=30)
+        for scale in (1e-12, 1e12):
+            self.assertSolves(
+                scale * A, scale * b,
+                gauss_solver(np.column_stack((scale * A, scale * b))), 0)
+
+    def test_stack(self) -> None:
+        rng = np.random.default_rng(5)
+        A = rng.uniform(low=1, high=50, size=(10, 8, 8))
+        A[3] = rank_deficient(rng, 8)[0]
+        b = np.einsum('kij,kj->ki', A, rng.uniform(size=(10, 8)))
+        solutions = gauss_solver(np.concatenate((A, b[:, :, np.newaxis]),
+                                                axis=2))
+        for k in range(10):
+            self.assertSolves(A[k], b[k], solutions[k], 4 if k == 3 else 0)
+
+    def test_work_buffer(self) -> None:
+        rng = np.random.default_rng(12)
+        A, b = rank_deficient(rng, 40)
+        solution = gauss_solver(np.column_stack((A, b)))
+        coeffs = rng.uniform(size=(5, 20))
+        out = np.empty((5, 40))
+        work = np.empty((5, 20))
+        self.assertIs(solution.solutions()(coeffs, out=out, work=work), out)
+        np.testing.assert_array_equal(out, solution.solutions()(coeffs))
+        solution.solutions()(coeffs[0], out=out[0], work=work[0])
+        np.testing.assert_array_equal(out[0], solution.solutions()(coeffs[0]))
+
+
+class LUFactorizationTest(SolverTestCase):
+    def test_full_rank(self) -> None:
+        rng = np.random.default_rng(6)
+        A = rng.uniform(low=1, high=50, size=(50, 50))
+        b = rng.uniform(low=1, high=50, size=(50, 3))
+        for i, solution in enumerate(LUFactorization(A).solve(b)):
+            self.assertSolves(A, b[:, i], solution, 0)
+
+    def test_rank_deficient(self) -> None:
+        rng = np.random.default_rng(7)
+        for n in (20, 100, 200):
+            A, _ = rank_deficient(rng, n)
+            b = A @ rng.uniform(size=(n, 3))
+            lu = LUFactorization(A)
+            self.assertEqual(lu.rank(), n // 2)
+            for i, solution in enumerate(lu.solve(b)):
+                self.assertSolves(A, b[:, i], solution, n - n // 2)
+            # Несовместная правая часть
+            self.assertIsNone(lu.solve(b[:, 0] + rng.uniform(size=n)))
+
+
+class BlockedGaussSolverTest(SolverTestCase):
+    def test_rank_deficient(self) -> None:
+        rng = np.random.default_rng(8)
+        for n in (20, 200, 400):
+            A, b = rank_deficient(rng, n)
+            for block_size in (7, 64):
+                self.assertSolves(
+                    A, b, blocked_gauss_solver(np.column_stack((A, b)),
+                                               block_size), n - n // 2)
+            b = b + rng.uniform(size=n)
+            self.assertIsNone(blocked_gauss_solver(np.column_stack((A, b)),
+                                                   64))
+
+    def test_memmap(self) -> None:
+        rng = np.random.default_rng(9)
+        A = rng.uniform(low=1, high=50, size=(300, 300))
+        b = rng.uniform(low=1, high=50, size=300)
+        with tempfile.TemporaryDirectory() as work_dir:
+            A_B = np.memmap(os.path.join(work_dir, 'A_B.dat'),
+                            dtype=np.float64, mode='w+', shape=(300, 301))
+            A_B[:] = np.column_stack((A, b))
+            self.assertSolves(A, b, blocked_gauss_solver(A_B, 64), 0)
+            del A_B
+
+
+@unittest.skipIf(sparse is None, 'scipy is not installed')
+class SparseGaussSolverTest(SolverTestCase):
+    def test_laplacian(self) -> None:
+        # Двумерный лапласиан на сетке 50 x 50 с точным решением из единиц
+        T = sparse.diags([-1.0, 2.0, -1.0], [-1, 0, 1], shape=(50, 50))
+        A = (sparse.kron(sparse.eye(50), T)
+             + sparse.kron(T, sparse.eye(50))).tocsr()
+        b = A @ np.ones(2500)
+        solution = gauss_solver(sparse.hstack((A, b[:, np.newaxis])).tocsr())
+        self.assertSolves(A, b, solution, 0)
+        self.assertLessEqual(np.max(np.abs(solution.solutions()() - 1)),
+                             1e-10)
+
+    def test_rank_deficient(self) -> None:
+        rng = np.random.default_rng(10)
+        A, b = rank_deficient(rng, 60)
+        A_B = sparse.csr_matrix(np.column_stack((A, b)))
+        self.assertSolves(A, b, gauss_solver(A_B), 30)
+        A_B = sparse.csr_matrix(np.column_stack((A, b + rng.uniform(
+            size=60))))
+        self.assertIsNone(gauss_solver(A_B))
+
+    def test_scale_invariance(self) -> None:
+        rng = np.random.default_rng(11)
+        A = sparse.random(40, 40, density=0.1, random_state=11) \
+            + 10 * sparse.eye(40)
+        b = rng.normal(size=40)
+        for scale in (1e-12, 1e12):
+            self.assertSolves(
+                scale * A, scale * b, gauss_solver(sparse.hstack(
+                    (scale * A, scale * b[:, np.newaxis])).tocsr()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()